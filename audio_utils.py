@@ -0,0 +1,270 @@
+# audio_utils.py
+
+import os
+import subprocess
+import wave
+import numpy as np
+
+SAMPLE_RATE = 16000  # Whisper expects 16 kHz mono
+
+
+def decode_audio(audio_path, sample_rate=SAMPLE_RATE, mmap_path=None):
+    """
+    Decodes any ffmpeg-readable file to 16 kHz mono PCM in a single pass.
+
+    With `mmap_path`, the PCM is written to that file and memory-mapped instead
+    of held in RAM; an existing file newer than the audio is reused as is.
+
+    Returns:
+        np.ndarray: int16 samples (half the memory of float32 for long lectures)
+    """
+    if mmap_path:
+        return _decode_to_memmap(audio_path, sample_rate, mmap_path)
+
+    pcm = _read_native_wav(audio_path, sample_rate)
+    if pcm is not None:
+        return pcm
+
+    result = subprocess.run(_ffmpeg_cmd(audio_path, sample_rate, "-"),
+                            stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=False)
+    if result.returncode != 0:
+        raise RuntimeError(f"ffmpeg failed to decode {audio_path}: {result.stderr.decode(errors='ignore').strip()}")
+    return np.frombuffer(result.stdout, dtype=np.int16)
+
+
+def _ffmpeg_cmd(audio_path, sample_rate, output):
+    return [
+        "ffmpeg", "-nostdin", "-loglevel", "error", "-y",
+        "-i", audio_path,
+        "-f", "s16le", "-acodec", "pcm_s16le",
+        "-ac", "1", "-ar", str(sample_rate),
+        output
+    ]
+
+
+def _decode_to_memmap(audio_path, sample_rate, mmap_path):
+    if not (os.path.exists(mmap_path) and os.path.getmtime(mmap_path) >= os.path.getmtime(audio_path)):
+        os.makedirs(os.path.dirname(mmap_path) or ".", exist_ok=True)
+        tmp_path = mmap_path + ".tmp"
+        pcm = _read_native_wav(audio_path, sample_rate)
+        if pcm is not None:
+            pcm.tofile(tmp_path)
+        else:
+            result = subprocess.run(_ffmpeg_cmd(audio_path, sample_rate, tmp_path),
+                                    stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, check=False)
+            if result.returncode != 0:
+                raise RuntimeError(f"ffmpeg failed to decode {audio_path}: {result.stderr.decode(errors='ignore').strip()}")
+        os.replace(tmp_path, mmap_path)
+
+    if os.path.getsize(mmap_path) == 0:
+        return np.zeros(0, dtype=np.int16)  # np.memmap cannot map an empty file
+    return np.memmap(mmap_path, dtype=np.int16, mode="r")
+
+
+def _read_native_wav(audio_path, sample_rate):
+    # WAV files already in Whisper's format are read directly, skipping ffmpeg
+    if not audio_path.lower().endswith(".wav"):
+        return None
+    try:
+        with wave.open(audio_path, "rb") as wav:
+            if (wav.getnchannels(), wav.getsampwidth(), wav.getframerate()) != (1, 2, sample_rate):
+                return None
+            return np.frombuffer(wav.readframes(wav.getnframes()), dtype=np.int16)
+    except (wave.Error, EOFError):
+        return None
+
+
+def to_float32(pcm):
+    """Converts int16 PCM to the float32 [-1, 1] range Whisper works on."""
+    return pcm.astype(np.float32) / 32768.0
+
+
+def frame_energy(pcm, sample_rate=SAMPLE_RATE, frame_ms=30, block_frames=4096):
+    """
+    Vectorised RMS energy per frame, computed in blocks so a memory-mapped
+    lecture is never converted to float32 all at once.
+
+    Returns:
+        tuple: (energies array, samples per frame)
+    """
+    frame_len = int(sample_rate * frame_ms / 1000)
+    n_frames = len(pcm) // frame_len
+    energies = np.zeros(n_frames, dtype=np.float32)
+    for lo in range(0, n_frames, block_frames):
+        hi = min(n_frames, lo + block_frames)
+        frames = np.asarray(pcm[lo * frame_len:hi * frame_len]).reshape(hi - lo, frame_len).astype(np.float32)
+        energies[lo:hi] = np.sqrt(np.mean(frames * frames, axis=1))
+    return energies, frame_len
+
+
+def speech_threshold(energies, min_separation_db=10.0):
+    """
+    Splits frame levels into a noise floor and a speech level (Otsu's method on
+    the dB histogram, so it adapts to the recording instead of assuming a fixed
+    ratio above the quietest frames).
+
+    Returns:
+        float or None: RMS threshold, or None if the levels don't separate into
+        two groups at least `min_separation_db` apart (steady noise, or speech
+        without any quiet frames)
+    """
+    levels = 20 * np.log10(np.maximum(energies, 1.0))
+    hist, edges = np.histogram(levels, bins=64)
+    centers = (edges[:-1] + edges[1:]) / 2
+    w0 = np.cumsum(hist)[:-1].astype(np.float64)
+    w1 = len(levels) - w0
+    sum0 = np.cumsum(hist * centers)[:-1]
+    valid = (w0 > 0) & (w1 > 0)
+    if not valid.any():
+        return None
+    m0 = np.where(valid, sum0 / np.maximum(w0, 1), 0.0)
+    m1 = np.where(valid, (np.sum(hist * centers) - sum0) / np.maximum(w1, 1), 0.0)
+    between = np.where(valid, w0 * w1 * (m1 - m0) ** 2, -1.0)
+    k = int(np.argmax(between))
+    if m1[k] - m0[k] < min_separation_db:
+        return None
+    return float(10 ** (edges[k + 1] / 20))
+
+
+def detect_speech(energies, frame_len, total, sample_rate=SAMPLE_RATE, min_rms=100.0, min_separation_db=10.0,
+                  min_silence_sec=1.0, min_speech_sec=0.3, pad_sec=0.2):
+    """
+    Energy-based voice activity detection. A frame is speech when its RMS is
+    above the noise-floor/speech split (see speech_threshold, at least
+    `min_rms`). Pauses shorter than `min_silence_sec` stay inside speech and
+    short blips are dropped, so only breaks, long silences and noise between them go.
+    Audio without a usable split is all speech, unless it is all below `min_rms`.
+
+    Returns:
+        np.ndarray: (n, 2) frame-aligned [start, end) sample ranges of speech
+    """
+    everything = np.array([[0, total]], dtype=np.int64) if total else np.zeros((0, 2), dtype=np.int64)
+    if len(energies) == 0:
+        return everything
+
+    threshold = speech_threshold(energies, min_separation_db)
+    if threshold is None:
+        if float(np.percentile(energies, 90)) < min_rms:
+            return np.zeros((0, 2), dtype=np.int64)  # Near-silent throughout
+        return everything
+    threshold = max(threshold, min_rms)
+    speech = np.concatenate(([0], (energies > threshold).astype(np.int8), [0]))
+    edges = np.diff(speech)
+    starts = np.flatnonzero(edges == 1)
+    ends = np.flatnonzero(edges == -1)
+    if len(starts) == 0:
+        return np.zeros((0, 2), dtype=np.int64)
+
+    frame_sec = frame_len / sample_rate
+    # Bridge short pauses, then drop runs too short to be words
+    keep = (starts[1:] - ends[:-1]) * frame_sec >= min_silence_sec
+    starts = starts[np.concatenate(([True], keep))]
+    ends = ends[np.concatenate((keep, [True]))]
+    long_enough = (ends - starts) * frame_sec >= min_speech_sec
+    starts, ends = starts[long_enough], ends[long_enough]
+
+    pad = int(round(pad_sec / frame_sec))
+    starts = np.maximum(starts - pad, 0)
+    ends = np.minimum(ends + pad, len(energies))
+    regions = np.stack((starts, ends), axis=1).astype(np.int64) * frame_len
+    if len(regions) and ends[-1] == len(energies):
+        regions[-1, 1] = total  # Keep the partial frame at the very end
+    return regions
+
+
+def build_speech_map(regions):
+    """
+    Timestamp map between the speech-only ("compact") audio and the original.
+
+    Returns:
+        dict: regions (original sample ranges), offsets (compact start of each
+              region) and total (compact length in samples)
+    """
+    lengths = regions[:, 1] - regions[:, 0]
+    offsets = np.concatenate(([0], np.cumsum(lengths)[:-1])).astype(np.int64)
+    return {"regions": regions, "offsets": offsets, "total": int(lengths.sum())}
+
+
+def compact_energies(energies, speech_map, frame_len):
+    """Frame energies of the speech-only audio (regions are frame-aligned)."""
+    if len(speech_map["regions"]) == 0:
+        return np.zeros(0, dtype=np.float32)
+    return np.concatenate([energies[start // frame_len:end // frame_len] for start, end in speech_map["regions"]])
+
+
+def gather_samples(pcm, speech_map, start, end):
+    """Samples [start, end) of the speech-only audio, copied from the original PCM."""
+    regions, offsets = speech_map["regions"], speech_map["offsets"]
+    i = max(0, int(np.searchsorted(offsets, start, side="right")) - 1)
+    pieces = []
+    pos = start
+    while pos < end and i < len(regions):
+        region_start, region_end = regions[i]
+        lo = region_start + (pos - offsets[i])
+        hi = min(region_end, region_start + (end - offsets[i]))
+        if hi > lo:
+            pieces.append(pcm[lo:hi])
+            pos = offsets[i] + (hi - region_start)
+        i += 1
+    return np.concatenate(pieces) if pieces else np.zeros(0, dtype=np.int16)
+
+
+def to_original_sample(sample, speech_map):
+    """Maps a sample position in the speech-only audio back to the original audio."""
+    regions, offsets = speech_map["regions"], speech_map["offsets"]
+    if len(regions) == 0:
+        return sample
+    i = max(0, int(np.searchsorted(offsets, sample, side="right")) - 1)
+    return int(min(regions[i, 0] + (sample - offsets[i]), regions[i, 1]))
+
+
+def plan_windows(pcm, sample_rate=SAMPLE_RATE, window_sec=120, search_sec=10, overlap_sec=1.0):
+    """
+    Cuts the audio into windows of roughly `window_sec`, placing each cut at the
+    quietest frame within `search_sec` of the target so words are not split.
+
+    Each window extends `overlap_sec` past its cut; the next window starts at the cut.
+
+    Returns:
+        list: dicts with start/end sample indices and the cut sample of each window
+    """
+    energies, frame_len = frame_energy(pcm, sample_rate)
+    return plan_windows_from_energies(energies, frame_len, len(pcm), sample_rate, window_sec, search_sec, overlap_sec)
+
+
+def plan_windows_from_energies(energies, frame_len, total, sample_rate=SAMPLE_RATE, window_sec=120,
+                               search_sec=10, overlap_sec=1.0):
+    """plan_windows for precomputed frame energies of `total` samples."""
+    # Light smoothing so a single quiet frame inside a word does not win
+    if len(energies) >= 5:
+        energies = np.convolve(energies, np.ones(5, dtype=np.float32) / 5, mode="same")
+
+    target = int(window_sec * sample_rate)
+    search = int(search_sec * sample_rate)
+    overlap = int(overlap_sec * sample_rate)
+
+    windows = []
+    start = 0
+    while start < total:
+        if total - start <= target + search:
+            windows.append({"start": start, "end": total, "cut": total})
+            break
+
+        # The cut is at least a frame past start, or windows shorter than the search span never advance
+        lo = max((start + target - search) // frame_len, start // frame_len + 1)
+        hi = min((start + target + search) // frame_len, len(energies))
+        cut = (lo + int(np.argmin(energies[lo:hi]))) * frame_len if hi > lo else start + max(target, frame_len)
+        windows.append({"start": start, "end": min(total, cut + overlap), "cut": cut})
+        start = cut
+
+    return windows
+
+
+def write_wav(path, pcm, sample_rate=SAMPLE_RATE):
+    """Writes int16 mono PCM to a WAV file (used to hand windows to the whisper CLI)."""
+    with wave.open(path, "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(sample_rate)
+        wav.writeframes(np.ascontiguousarray(pcm, dtype=np.int16).tobytes())
+    return path
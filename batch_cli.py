@@ -0,0 +1,267 @@
+# batch_cli.py
+#
+# Headless batch mode: processes many lectures without the GUI.
+#
+#   python batch_cli.py lectures/                 # <dir>/<course>/<lecture>.mp3
+#   python batch_cli.py jobs.json --revision      # [{"course", "lecture", "audio", "language"}, ...]
+#   python batch_cli.py jobs.csv --whisper-workers 4 --llm-threads 8
+#
+# Whisper and Mistral run on separate worker pools, so lecture N+1 is being
+# transcribed while notes for lecture N are generated. Job state is saved after
+# every step; re-running the same command resumes where it stopped.
+
+import argparse
+import csv
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import mistral_notes
+from whisper_offline import transcribe_audio, set_abort_flag, should_abort, LANGUAGE_CODE_MAP, CPU_THREADS
+from mistral_notes import generate_notes_from_transcript
+from revision_generator import run_revision_pipeline
+from output_manager import create_output_paths, course_output_dir, save_transcript, save_log
+from tracing import trace_to
+
+OUTPUT_DIR = "Lecture_Outputs"
+STATE_FILE = "batch_state.json"
+REPORT_FILE = "batch_report.json"
+AUDIO_EXTENSIONS = (".mp3", ".wav", ".m4a", ".ogg", ".flac")
+
+
+def load_jobs(source, default_language="Arabic"):
+    """
+    Reads jobs from a directory tree (<course>/<lecture>.<ext>) or a JSON/CSV manifest.
+
+    Returns:
+        list: dicts with id, course, lecture, audio, language
+    """
+    jobs = []
+    if os.path.isdir(source):
+        for course in sorted(os.listdir(source)):
+            course_dir = os.path.join(source, course)
+            if not os.path.isdir(course_dir):
+                continue
+            for name in sorted(os.listdir(course_dir)):
+                if name.lower().endswith(AUDIO_EXTENSIONS):
+                    jobs.append({
+                        "course": course,
+                        "lecture": os.path.splitext(name)[0],
+                        "audio": os.path.join(course_dir, name),
+                        "language": default_language
+                    })
+    elif source.lower().endswith(".json"):
+        with open(source, "r", encoding="utf-8") as f:
+            jobs = json.load(f)
+    elif source.lower().endswith(".csv"):
+        with open(source, "r", encoding="utf-8", newline="") as f:
+            jobs = list(csv.DictReader(f))
+    else:
+        raise ValueError(f"Expected a directory, .json or .csv manifest: {source}")
+
+    for job in jobs:
+        job["language"] = job.get("language") or default_language
+        if job["language"] not in LANGUAGE_CODE_MAP:
+            raise ValueError(f"Unsupported language '{job['language']}' for {job['audio']}")
+        job["id"] = f"{job['course']}/{job['lecture']}"
+    return jobs
+
+
+class JobState:
+    """
+    Persistent per-job status (pending -> transcribed -> done, or failed),
+    written atomically after every change so a crash loses at most one step.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.jobs = {}
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                self.jobs = json.load(f).get("jobs", {})
+
+    def get(self, job_id):
+        with self.lock:
+            return dict(self.jobs.get(job_id, {"status": "pending"}))
+
+    def update(self, job_id, **fields):
+        with self.lock:
+            self.jobs.setdefault(job_id, {"status": "pending"}).update(fields)
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"jobs": self.jobs, "updated": datetime.now().isoformat()}, f, indent=2, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+
+
+def run_whisper_stage(job, state, whisper_workers, whisper_threads):
+    """Transcribes one job and saves the transcript next to its notes."""
+    lecture_dir = create_output_paths(OUTPUT_DIR, job["course"], job["lecture"])
+    print(f"[BATCH] Transcribing {job['id']}")
+    started = time.perf_counter()
+    with trace_to(lecture_dir):
+        text, _, metadata = transcribe_audio(
+            job["audio"],
+            job["language"],
+            cpu_threads=whisper_threads,
+            workers=whisper_workers
+        )
+    if should_abort():
+        return None
+
+    # The decoded audio length: segments end at the last speech, well before the audio with VAD
+    audio_sec = json.loads(metadata).get("duration", 0.0)
+    transcript_path = save_transcript(text, lecture_dir, lang=LANGUAGE_CODE_MAP[job["language"]])
+    elapsed = time.perf_counter() - started
+    save_log(f"[BATCH] Transcribed in {elapsed:.1f}s", lecture_dir)
+    state.update(
+        job["id"],
+        status="transcribed",
+        transcript=transcript_path,
+        audio_sec=round(audio_sec, 2),
+        whisper_sec=round(elapsed, 2)
+    )
+    return transcript_path
+
+
+def run_mistral_stage(job, state, rerank, include_exam):
+    """Generates notes for a transcribed job."""
+    info = state.get(job["id"])
+    with open(info["transcript"], "r", encoding="utf-8") as f:
+        transcript_text = f.read()
+
+    print(f"[BATCH] Generating notes for {job['id']}")
+    started = time.perf_counter()
+    notes = generate_notes_from_transcript(
+        transcript_text,
+        job["course"],
+        job["lecture"],
+        rerank=rerank,
+        include_exam=include_exam
+    )
+    if should_abort():
+        return
+    elapsed = time.perf_counter() - started
+    state.update(job["id"], status="done", chunks=len(notes), notes_sec=round(elapsed, 2))
+
+
+def run_batch(jobs, state, whisper_workers, whisper_threads, rerank=True, include_exam=True):
+    """
+    Runs every unfinished job. One thread feeds jobs through Whisper (which
+    itself fans out over `whisper_workers` processes); finished transcripts are
+    handed to a separate single-thread Mistral pool.
+    """
+    mistral_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="mistral")
+    futures = []
+
+    def submit_notes(job):
+        def task():
+            try:
+                run_mistral_stage(job, state, rerank, include_exam)
+            except Exception as e:
+                print(f"[BATCH] Notes failed for {job['id']}: {e}")
+                state.update(job["id"], status="failed", error=str(e))
+        futures.append(mistral_pool.submit(task))
+
+    try:
+        for job in jobs:
+            if should_abort():
+                break
+            status = state.get(job["id"])["status"]
+            if status == "done":
+                print(f"[BATCH] Skipping finished job {job['id']}")
+                continue
+            if status != "transcribed":
+                try:
+                    if run_whisper_stage(job, state, whisper_workers, whisper_threads) is None:
+                        break
+                except Exception as e:
+                    print(f"[BATCH] Transcription failed for {job['id']}: {e}")
+                    state.update(job["id"], status="failed", error=str(e))
+                    continue
+            submit_notes(job)
+        for future in futures:
+            future.result()
+    except KeyboardInterrupt:
+        set_abort_flag()  # Lets the running stage stop at its next check
+        raise
+    finally:
+        mistral_pool.shutdown(wait=True, cancel_futures=should_abort())
+
+
+def write_report(jobs, state, path):
+    """Writes per-job throughput (real-time factors) as JSON and prints a summary."""
+    rows = []
+    for job in jobs:
+        info = state.get(job["id"])
+        audio_sec = info.get("audio_sec") or 0.0
+        whisper_sec = info.get("whisper_sec")
+        notes_sec = info.get("notes_sec")
+        rows.append({
+            "id": job["id"],
+            "status": info["status"],
+            "audio_sec": audio_sec,
+            "whisper_sec": whisper_sec,
+            "notes_sec": notes_sec,
+            "chunks": info.get("chunks"),
+            "whisper_rtf": round(whisper_sec / audio_sec, 3) if whisper_sec and audio_sec else None,
+            "notes_sec_per_chunk": round(notes_sec / info["chunks"], 2) if notes_sec and info.get("chunks") else None,
+            "error": info.get("error")
+        })
+
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"generated": datetime.now().isoformat(), "jobs": rows}, f, indent=2, ensure_ascii=False)
+
+    for row in rows:
+        print(f"[REPORT] {row['id']}: {row['status']}, audio {row['audio_sec']:.0f}s, "
+              f"whisper RTF {row['whisper_rtf']}, {row['notes_sec_per_chunk']} s/chunk")
+    print(f"[REPORT] Saved to {path}")
+
+
+def main():
+    cores = os.cpu_count() or 2
+    parser = argparse.ArgumentParser(description="Process a backlog of lectures without the GUI.")
+    parser.add_argument("source", help="Directory of <course>/<lecture>.mp3 or a .json/.csv manifest")
+    parser.add_argument("--language", default="Arabic", choices=sorted(LANGUAGE_CODE_MAP), help="Default audio language")
+    parser.add_argument("--whisper-workers", type=int, default=max(1, cores // 2 // CPU_THREADS),
+                        help="Whisper worker processes")
+    parser.add_argument("--whisper-threads", type=int, default=CPU_THREADS, help="CPU threads per Whisper worker")
+    parser.add_argument("--llm-threads", type=int, default=mistral_notes.LLM_THREADS,
+                        help="CPU threads for Mistral (default: calibrated profile or half the cores)")
+    parser.add_argument("--llm-workers", type=int, default=0,
+                        help="Mistral worker processes for parallel chunk notes (0 = sequential, -1 = auto)")
+    parser.add_argument("--no-rerank", action="store_true", help="Keep chunks in lecture order")
+    parser.add_argument("--no-exam", action="store_true", help="Skip exam alerts and questions")
+    parser.add_argument("--revision", action="store_true", help="Generate a revision summary per course afterwards")
+    parser.add_argument("--state", default=STATE_FILE, help="Job state file (used to resume)")
+    parser.add_argument("--report", default=REPORT_FILE, help="Throughput report path")
+    args = parser.parse_args()
+
+    # CPU budget for the Mistral stage (shared model, so both modules must agree)
+    mistral_notes.LLM_THREADS = args.llm_threads  # Revision runs on mistral_notes' model settings
+    mistral_notes.PARALLEL_WORKERS = args.llm_workers  # Parallel mode sizes its own threads per worker
+
+    jobs = load_jobs(args.source, args.language)
+    state = JobState(args.state)
+    print(f"[BATCH] {len(jobs)} jobs, Whisper {args.whisper_workers}x{args.whisper_threads} threads, "
+          f"Mistral {args.llm_threads} threads")
+
+    try:
+        run_batch(jobs, state, args.whisper_workers, args.whisper_threads,
+                  rerank=not args.no_rerank, include_exam=not args.no_exam)
+
+        if args.revision and not should_abort():
+            for course in sorted({job["course"] for job in jobs}):
+                run_revision_pipeline(course_output_dir(OUTPUT_DIR, course))
+    except KeyboardInterrupt:
+        set_abort_flag()
+        print("[BATCH] Interrupted; progress saved, re-run to resume.")
+    finally:
+        write_report(jobs, state, args.report)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,332 @@
+# benchmark.py
+#
+# Benchmark harness for the lecture pipeline.
+#
+#   python benchmark.py                          # stand-in engines, runs anywhere
+#   python benchmark.py --minutes 30 --output before.json
+#   python benchmark.py --real --audio lecture.mp3 --model mistral-7b-instruct-v0.1.Q4_K_M.gguf
+#
+# Stub mode swaps in deterministic Whisper and Llama stand-ins that simulate
+# latency (per audio second, per prompt token, per generated token), so results
+# are comparable between runs and machines without any model files. Results are
+# printed (or written) as JSON: real-time factor, tokens/sec, per-chunk latency
+# percentiles and peak RSS.
+
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+import zlib
+from collections import namedtuple
+
+import numpy as np
+
+import model_registry
+import whisper_offline
+import mistral_notes
+from audio_utils import SAMPLE_RATE, decode_audio, write_wav
+from llm_cache import cache_stats
+from utils import (
+    split_into_chunks,
+    split_into_token_chunks,
+    prepare_contextual_prompt,
+    score_chunk_for_importance,
+    extract_key_summary
+)
+
+# Simulated engine costs (stub mode)
+STUB_WHISPER_RTF = 0.05         # Seconds of compute per second of audio
+STUB_PROMPT_SEC_PER_TOKEN = 0.0002
+STUB_GEN_SEC_PER_TOKEN = 0.002
+STUB_OUTPUT_TOKENS = 300
+
+WORDS = ["البيانات", "النموذج", "model", "NumPy", "المصفوفة", "Pandas", "التعلم", "الدالة", "training", "القيمة"]
+
+StubSegment = namedtuple("StubSegment", "start end text")
+
+
+class StubWhisperModel:
+    """Stand-in for faster_whisper.WhisperModel: one segment per 5 s of audio."""
+
+    def __init__(self, model_size, device="cpu", compute_type="int8", cpu_threads=1):
+        self.cpu_threads = cpu_threads
+
+    def transcribe(self, audio, language="ar", task="transcribe", beam_size=5):
+        duration = len(audio) / SAMPLE_RATE
+
+        def segments():
+            start = 0.0
+            while start < duration:
+                end = min(duration, start + 5.0)
+                time.sleep((end - start) * STUB_WHISPER_RTF)
+                rng = random.Random(int(start * 1000) ^ len(audio))
+                text = " ".join(rng.choice(WORDS) for _ in range(12)) + "."
+                yield StubSegment(start, end, text)
+                start = end
+
+        return segments(), {"language": language, "duration": duration}
+
+
+class StubLlama:
+    """
+    Stand-in for llama_cpp.Llama covering what the pipeline uses: tokenize,
+    reset/eval/save_state/load_state (prefix caching), streamed completion and embed.
+    """
+
+    def __init__(self, model_path=None, n_ctx=4096, **params):
+        self.n_ctx = n_ctx
+        self.n_tokens = 0
+
+    def tokenize(self, text, add_bos=True, special=False):
+        # ~3 bytes per token, deterministic
+        return list(range((len(text) + 2) // 3 + (1 if add_bos else 0)))
+
+    def reset(self):
+        self.n_tokens = 0
+
+    def eval(self, tokens):
+        time.sleep(len(tokens) * STUB_PROMPT_SEC_PER_TOKEN)
+        self.n_tokens = len(tokens)
+
+    def save_state(self):
+        return self.n_tokens
+
+    def load_state(self, state):
+        self.n_tokens = state
+
+    def close(self):
+        pass
+
+    def embed(self, text):
+        # Deterministic bag-of-words vector, so similar sections land close together
+        vector = np.zeros(64, dtype=np.float32)
+        for word in text.split():
+            vector[zlib.crc32(word.encode("utf-8")) % 64] += 1.0
+        return vector.tolist()
+
+    def __call__(self, prompt, max_tokens=16, stream=False, **kwargs):
+        prompt_tokens = len(self.tokenize(prompt.encode("utf-8")))
+        # Only the part after the restored prefix state is evaluated
+        time.sleep(max(0, prompt_tokens - self.n_tokens) * STUB_PROMPT_SEC_PER_TOKEN)
+        pieces = _stub_note_pieces(min(max_tokens, STUB_OUTPUT_TOKENS), prompt_tokens)
+        self.n_tokens = 0
+
+        def generate():
+            for piece in pieces:
+                time.sleep(STUB_GEN_SEC_PER_TOKEN)
+                yield {"choices": [{"text": piece}]}
+
+        if stream:
+            return generate()
+        return {"choices": [{"text": "".join(c["choices"][0]["text"] for c in generate())}]}
+
+
+def _stub_note_pieces(n_tokens, seed):
+    rng = random.Random(seed)
+    sections = ["### 🧠 Key Takeaways", "### 📘 Definitions & Terms", "### 🔍 Inferred Importance",
+                "### 🎯 Exam Alerts", "### 📝 Potential Exam Questions"]
+    pieces = []
+    for section in sections:
+        pieces.append(f"\n{section}\n")
+        for _ in range(3):
+            pieces.append("- ")
+            pieces.extend(f"{rng.choice(WORDS)} " for _ in range(6))
+            pieces.append("\n")
+    while len(pieces) < n_tokens:
+        pieces.append(f"{rng.choice(WORDS)} ")
+    return pieces[:n_tokens]
+
+
+def synthetic_transcript(words, seed=0):
+    rng = random.Random(seed)
+    sentences = []
+    for _ in range(max(1, words // 12)):
+        sentences.append(" ".join(rng.choice(WORDS) for _ in range(12)) + rng.choice([".", "؟", "،", "."]))
+    return " ".join(sentences)
+
+
+def synthetic_audio(path, minutes, seed=0):
+    """Speech-like bursts of noise separated by short silences, as 16 kHz mono WAV."""
+    rng = np.random.default_rng(seed)
+    total = int(minutes * 60 * SAMPLE_RATE)
+    pcm = np.zeros(total, dtype=np.int16)
+    pos = 0
+    while pos < total:
+        burst = int(rng.uniform(2.0, 6.0) * SAMPLE_RATE)
+        end = min(total, pos + burst)
+        pcm[pos:end] = (rng.standard_normal(end - pos) * 3000).astype(np.int16)
+        pos = end + int(rng.uniform(0.3, 1.0) * SAMPLE_RATE)
+    return write_wav(path, pcm)
+
+
+def peak_rss_mb():
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return round(peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024, 1)
+    except ImportError:
+        import psutil
+        return round(psutil.Process().memory_info().rss / (1024 * 1024), 1)
+
+
+def percentiles(values):
+    if not values:
+        return {}
+    ordered = np.asarray(values, dtype=np.float64)
+    return {
+        "p50": round(float(np.percentile(ordered, 50)), 6),
+        "p90": round(float(np.percentile(ordered, 90)), 6),
+        "p99": round(float(np.percentile(ordered, 99)), 6),
+        "max": round(float(ordered.max()), 6)
+    }
+
+
+def time_calls(fn, repeat):
+    """Calls fn() `repeat` times; returns per-call latency stats in seconds."""
+    latencies = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        latencies.append(time.perf_counter() - started)
+    return {"calls": repeat, "mean_sec": round(sum(latencies) / repeat, 6), **percentiles(latencies)}
+
+
+def bench_chunking(transcript):
+    count_tokens = mistral_notes.load_token_counter()
+    budget = mistral_notes.chunk_token_budget(count_tokens)
+    result = {"transcript_chars": len(transcript)}
+
+    started = time.perf_counter()
+    chunks = split_into_chunks(transcript)
+    result["split_into_chunks"] = {"sec": round(time.perf_counter() - started, 4), "chunks": len(chunks)}
+
+    started = time.perf_counter()
+    chunks = split_into_token_chunks(transcript, budget, count_tokens)
+    result["split_into_token_chunks"] = {
+        "sec": round(time.perf_counter() - started, 4),
+        "chunks": len(chunks),
+        "token_budget": budget
+    }
+    return result, chunks
+
+
+def bench_prompt_and_scoring(chunks, note_text):
+    return {
+        "prepare_contextual_prompt": time_calls(
+            lambda: prepare_contextual_prompt(chunks[0], previous_chunk="- context", translate_to_english=True), 200),
+        "score_chunk_for_importance": time_calls(lambda: score_chunk_for_importance(note_text), 500),
+        "extract_key_summary": time_calls(lambda: extract_key_summary(note_text), 500)
+    }
+
+
+def bench_transcribe(audio_path, workers):
+    # The real length: the last segment ends early on trailing silence and is missing with no speech
+    audio_sec = len(decode_audio(audio_path)) / SAMPLE_RATE
+    started = time.perf_counter()
+    text, _, metadata = whisper_offline.transcribe_audio(audio_path, "Arabic", workers=workers)
+    elapsed = time.perf_counter() - started
+    segments = json.loads(metadata)["segments"]
+    return {
+        "audio_sec": round(audio_sec, 1),
+        "wall_sec": round(elapsed, 3),
+        "real_time_factor": round(elapsed / audio_sec, 4) if audio_sec else None,
+        "segments": len(segments),
+        "peak_rss_mb": peak_rss_mb()
+    }, text
+
+
+def bench_generate_notes(transcript):
+    """Runs generate_notes_from_transcript, timing every model call and counting streamed tokens."""
+    latencies = []
+    tokens = [0]
+    original_run_model = mistral_notes.run_model
+
+    def timed_run_model(prompt, prefix, max_tokens=mistral_notes.MAX_TOKENS, on_token=None, grammar=None):
+        def counting(piece):
+            tokens[0] += 1
+            if on_token:
+                on_token(piece)
+        started = time.perf_counter()
+        result = original_run_model(prompt, prefix, max_tokens, counting, grammar)
+        latencies.append(time.perf_counter() - started)
+        return result
+
+    mistral_notes.run_model = timed_run_model
+    try:
+        started = time.perf_counter()
+        notes = mistral_notes.generate_notes_from_transcript(transcript, "Benchmark", "Lecture", rerank=True)
+        elapsed = time.perf_counter() - started
+    finally:
+        mistral_notes.run_model = original_run_model
+
+    return {
+        "chunks": len(notes),
+        "wall_sec": round(elapsed, 3),
+        "generated_tokens": tokens[0],
+        "tokens_per_sec": round(tokens[0] / elapsed, 2) if elapsed else None,
+        "chunk_latency_sec": percentiles(latencies),
+        "peak_rss_mb": peak_rss_mb()
+    }, notes
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the lecture pipeline.")
+    parser.add_argument("--real", action="store_true", help="Use the real Whisper and GGUF models")
+    parser.add_argument("--model", default=mistral_notes.MODEL_PATH, help="GGUF model path (real mode)")
+    parser.add_argument("--audio", help="Audio file to transcribe (default: synthetic audio)")
+    parser.add_argument("--minutes", type=float, default=10, help="Length of synthetic audio")
+    parser.add_argument("--words", type=int, default=20000, help="Length of synthetic transcript for chunking")
+    parser.add_argument("--workers", type=int, default=1, help="Whisper worker processes (stub mode runs in-process)")
+    parser.add_argument("--output", help="Write JSON results here instead of stdout")
+    args = parser.parse_args()
+
+    if not args.real:
+        model_registry.set_model_factory(StubLlama)
+        whisper_offline.set_whisper_factory(StubWhisperModel)
+        args.workers = 1  # Stub engines only exist in this process
+        mistral_notes.STRUCTURED_NOTES = False  # Grammars need llama_cpp; the stand-in ignores them anyway
+    mistral_notes.MODEL_PATH = os.path.abspath(args.model)
+    audio_path = os.path.abspath(args.audio) if args.audio else None
+
+    results = {
+        "mode": "real" if args.real else "stub",
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "host": {"platform": platform.platform(), "python": platform.python_version(), "cpus": os.cpu_count()},
+        "benchmarks": {}
+    }
+
+    # Run in a scratch directory so caches, checkpoints and outputs start empty
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as scratch:
+        os.chdir(scratch)
+        try:
+            transcript = synthetic_transcript(args.words)
+            results["benchmarks"]["chunking"], chunks = bench_chunking(transcript)
+            note_text = "".join(_stub_note_pieces(STUB_OUTPUT_TOKENS, 0))
+            results["benchmarks"]["prompt_and_scoring"] = bench_prompt_and_scoring(chunks, note_text)
+
+            if audio_path is None:
+                audio_path = synthetic_audio(os.path.join(scratch, "synthetic.wav"), args.minutes)
+            results["benchmarks"]["transcribe_audio"], lecture_text = bench_transcribe(audio_path, args.workers)
+
+            results["benchmarks"]["generate_notes"], _ = bench_generate_notes(lecture_text)
+            results["llm_cache"] = cache_stats()
+        finally:
+            os.chdir(cwd)
+
+    results["peak_rss_mb"] = peak_rss_mb()
+    report = json.dumps(results, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(report)
+        print(f"[BENCH] Results saved to {args.output}")
+    else:
+        print(report)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,228 @@
+# course_store.py
+#
+# One SQLite database per course (Lecture_Outputs/<course>/course.db) holding
+# every lecture artifact: transcripts, chunk notes with scores and summaries,
+# revision summaries and processing logs. WAL mode keeps readers (GUI, search)
+# unblocked while a lecture is written, and every save is one transaction, so
+# a crash leaves either the old or the new version, never half a file.
+# Text and Markdown files are exports of this data (see output_manager).
+
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+
+STORE_NAME = "course.db"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS lectures (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE,
+    created TEXT NOT NULL,
+    updated TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS transcripts (
+    lecture_id INTEGER NOT NULL REFERENCES lectures(id) ON DELETE CASCADE,
+    lang TEXT NOT NULL,
+    text TEXT NOT NULL,
+    updated TEXT NOT NULL,
+    PRIMARY KEY (lecture_id, lang)
+);
+CREATE TABLE IF NOT EXISTS chunk_notes (
+    lecture_id INTEGER NOT NULL REFERENCES lectures(id) ON DELETE CASCADE,
+    chunk_index INTEGER NOT NULL,
+    rank INTEGER NOT NULL,
+    content TEXT NOT NULL,
+    score REAL NOT NULL,
+    summary TEXT NOT NULL DEFAULT '',
+    PRIMARY KEY (lecture_id, chunk_index)
+);
+CREATE TABLE IF NOT EXISTS summaries (
+    scope TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    text TEXT NOT NULL,
+    updated TEXT NOT NULL,
+    PRIMARY KEY (scope, kind)
+);
+CREATE TABLE IF NOT EXISTS logs (
+    id INTEGER PRIMARY KEY,
+    lecture_id INTEGER REFERENCES lectures(id) ON DELETE CASCADE,
+    ts TEXT NOT NULL,
+    message TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS logs_by_lecture ON logs (lecture_id, id);
+"""
+
+COURSE_SCOPE = ""  # Summary scope for course-wide summaries (e.g. the revision)
+
+_stores_lock = threading.Lock()
+_stores = {}
+
+
+def _now():
+    return datetime.now().isoformat(timespec="seconds")
+
+
+class CourseStore:
+    """
+    Connection to one course database. Shared between threads; all access is
+    serialised by a lock, and writes go through `transaction()`.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.RLock()
+        self._depth = 0
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")  # Durable at checkpoints; WAL stays consistent on crash
+        self.conn.execute("PRAGMA foreign_keys=ON")
+        self.conn.executescript(SCHEMA)
+
+    @contextmanager
+    def transaction(self):
+        """
+        Groups writes into one atomic transaction. Nested use joins the
+        outer transaction, so callers can batch several saves together.
+        """
+        with self.lock:
+            if self._depth:
+                self._depth += 1
+                try:
+                    yield self.conn
+                finally:
+                    self._depth -= 1
+                return
+            self._depth = 1
+            try:
+                with self.conn:  # Commits on success, rolls back on error
+                    yield self.conn
+            finally:
+                self._depth = 0
+
+    def _lecture_id(self, conn, lecture, create=True):
+        row = conn.execute("SELECT id FROM lectures WHERE name = ?", (lecture,)).fetchone()
+        if row:
+            if create:
+                conn.execute("UPDATE lectures SET updated = ? WHERE id = ?", (_now(), row["id"]))
+            return row["id"]
+        if not create:
+            return None
+        now = _now()
+        return conn.execute("INSERT INTO lectures (name, created, updated) VALUES (?, ?, ?)",
+                            (lecture, now, now)).lastrowid
+
+    # --- Writes ---
+
+    def save_transcript(self, lecture, text, lang):
+        with self.transaction() as conn:
+            lecture_id = self._lecture_id(conn, lecture)
+            conn.execute("INSERT OR REPLACE INTO transcripts (lecture_id, lang, text, updated) VALUES (?, ?, ?, ?)",
+                         (lecture_id, lang, text, _now()))
+
+    def save_chunk_notes(self, lecture, notes):
+        """
+        Replaces a lecture's chunk notes in one transaction. `notes` is in
+        display order (e.g. re-ranked), which is kept as the rank.
+        """
+        with self.transaction() as conn:
+            lecture_id = self._lecture_id(conn, lecture)
+            conn.execute("DELETE FROM chunk_notes WHERE lecture_id = ?", (lecture_id,))
+            conn.executemany(
+                "INSERT INTO chunk_notes (lecture_id, chunk_index, rank, content, score, summary) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                [(lecture_id, n["index"], rank, n["content"], n["score"], n.get("summary", ""))
+                 for rank, n in enumerate(notes)]
+            )
+
+    def save_summary(self, scope, kind, text):
+        with self.transaction() as conn:
+            conn.execute("INSERT OR REPLACE INTO summaries (scope, kind, text, updated) VALUES (?, ?, ?, ?)",
+                         (scope, kind, text, _now()))
+
+    def log(self, lecture, message):
+        with self.transaction() as conn:
+            lecture_id = self._lecture_id(conn, lecture) if lecture else None
+            conn.execute("INSERT INTO logs (lecture_id, ts, message) VALUES (?, ?, ?)", (lecture_id, _now(), message))
+
+    # --- Reads ---
+
+    def list_lectures(self):
+        """Lectures with their last update and what is stored for them."""
+        with self.lock:
+            rows = self.conn.execute("""
+                SELECT l.name, l.updated,
+                       (SELECT COUNT(*) FROM chunk_notes c WHERE c.lecture_id = l.id) AS chunks,
+                       (SELECT GROUP_CONCAT(t.lang) FROM transcripts t WHERE t.lecture_id = l.id) AS transcripts
+                FROM lectures l ORDER BY l.name
+            """).fetchall()
+        return [dict(row) for row in rows]
+
+    def get_transcript(self, lecture, lang=None):
+        """A lecture's transcript (any language if `lang` is None), or None."""
+        query = ("SELECT t.text FROM transcripts t JOIN lectures l ON l.id = t.lecture_id "
+                 "WHERE l.name = ?" + (" AND t.lang = ?" if lang else "") + " ORDER BY t.updated DESC LIMIT 1")
+        with self.lock:
+            row = self.conn.execute(query, (lecture, lang) if lang else (lecture,)).fetchone()
+        return row["text"] if row else None
+
+    def get_transcripts(self, lecture):
+        """All transcripts of a lecture, by language."""
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT t.lang, t.text FROM transcripts t JOIN lectures l ON l.id = t.lecture_id WHERE l.name = ?",
+                (lecture,)
+            ).fetchall()
+        return {row["lang"]: row["text"] for row in rows}
+
+    def get_chunk_notes(self, lecture):
+        """Chunk notes in saved (display) order, as note dicts."""
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT c.chunk_index AS \"index\", c.content, c.score, c.summary FROM chunk_notes c "
+                "JOIN lectures l ON l.id = c.lecture_id WHERE l.name = ? ORDER BY c.rank",
+                (lecture,)
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def get_summary(self, scope, kind):
+        with self.lock:
+            row = self.conn.execute("SELECT text FROM summaries WHERE scope = ? AND kind = ?", (scope, kind)).fetchone()
+        return row["text"] if row else None
+
+    def get_logs(self, lecture=None, limit=100):
+        """Most recent log lines, oldest first (all lectures if `lecture` is None)."""
+        with self.lock:
+            if lecture:
+                rows = self.conn.execute(
+                    "SELECT g.ts, g.message FROM logs g JOIN lectures l ON l.id = g.lecture_id "
+                    "WHERE l.name = ? ORDER BY g.id DESC LIMIT ?", (lecture, limit)).fetchall()
+            else:
+                rows = self.conn.execute("SELECT ts, message FROM logs ORDER BY id DESC LIMIT ?", (limit,)).fetchall()
+        return [dict(row) for row in reversed(rows)]
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+
+def get_store(course_dir):
+    """Returns the shared store for a course directory, opening it on first use."""
+    path = os.path.abspath(os.path.join(course_dir, STORE_NAME))
+    with _stores_lock:
+        store = _stores.get(path)
+        if store is None:
+            store = CourseStore(path)
+            _stores[path] = store
+        return store
+
+
+def close_all_stores():
+    with _stores_lock:
+        stores = list(_stores.values())
+        _stores.clear()
+    for store in stores:
+        store.close()
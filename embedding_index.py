@@ -0,0 +1,198 @@
+# embedding_index.py
+#
+# Vector index over note sections, used by the "retrieval" revision mode.
+#
+# Each (lecture, chunk, section) of a course's sidecars is embedded with the
+# local GGUF model in embedding mode and stored in a per-course NumPy matrix
+# (embeddings.npy) with a JSON list of what each row is (embeddings.json).
+# Updates are incremental: rows are keyed by a hash of their text, so only new
+# or edited sections are embedded. Revision then picks the most central and
+# exam-flagged sections that fit an exact token budget.
+
+import hashlib
+import json
+import os
+
+import numpy as np
+
+import mistral_notes
+from model_registry import use_model, inference_lock
+from notes_index import indexed_lectures, load_sidecar, format_sections, SIDECAR_NAME
+from utils import clip_to_token_budget
+from tracing import span
+
+EMBED_CTX = 1024                # Context of the embedding instance; longer sections are clipped
+EMBED_THREADS = max(1, (os.cpu_count() or 2) // 2)
+VECTORS_NAME = "embeddings.npy"
+META_NAME = "embeddings.json"
+
+EXAM_SECTIONS = ("exam_alerts", "questions")
+EXAM_BOOST = 0.15               # Added to the centrality of exam-flagged sections
+DUPLICATE_SIMILARITY = 0.95     # Sections this close to an already selected one are skipped
+
+
+def _model_fingerprint():
+    path = os.path.abspath(mistral_notes.MODEL_PATH)
+    return [path, os.path.getsize(path) if os.path.exists(path) else None]
+
+
+def _text_hash(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def section_units(course_dir, lecture):
+    """One unit per (chunk, section) of a lecture's sidecar."""
+    sidecar = load_sidecar(os.path.join(course_dir, lecture))
+    units = []
+    for chunk in (sidecar or {}).get("chunks", []):
+        for section, items in chunk["sections"].items():
+            if items:
+                text = format_sections({section: items})
+                units.append({"lecture": lecture, "chunk": chunk["index"], "section": section,
+                              "text": text, "hash": _text_hash(text)})
+    return units
+
+
+def embed_texts(texts):
+    """
+    Embeds texts with the GGUF model in embedding mode (a separate registry
+    instance; the weights are shared through mmap). Vectors are L2-normalised.
+
+    Returns:
+        np.ndarray: (len(texts), dim) float32
+    """
+    vectors = []
+    # Read at call time, so a different notes model (or the benchmark's --model) is used here too
+    with use_model(mistral_notes.MODEL_PATH, EMBED_CTX, embedding=True, n_threads=EMBED_THREADS) as llm, inference_lock(llm):
+        count_tokens = lambda text: len(llm.tokenize(text.encode("utf-8"), add_bos=True))
+        for text in texts:
+            vector = np.asarray(llm.embed(clip_to_token_budget(text, EMBED_CTX - 8, count_tokens)), dtype=np.float32)
+            if vector.ndim == 2:
+                vector = vector.mean(axis=0)  # Per-token output (no pooling): mean-pool
+            vectors.append(vector / (np.linalg.norm(vector) or 1.0))
+    return np.vstack(vectors) if vectors else np.zeros((0, 0), dtype=np.float32)
+
+
+def load_embedding_index(course_dir):
+    """Returns (vectors, meta) for a course, or empty ones if none exist yet."""
+    vectors_path = os.path.join(course_dir, VECTORS_NAME)
+    meta_path = os.path.join(course_dir, META_NAME)
+    if not (os.path.exists(vectors_path) and os.path.exists(meta_path)):
+        return np.zeros((0, 0), dtype=np.float32), {"lectures": {}, "units": []}
+    with open(meta_path, "r", encoding="utf-8") as f:
+        meta = json.load(f)
+    vectors = np.load(vectors_path)
+    # Vectors from another model are not comparable; a length mismatch means a torn update
+    if meta.get("model") != _model_fingerprint() or len(vectors) != len(meta["units"]):
+        return np.zeros((0, 0), dtype=np.float32), {"lectures": {}, "units": []}
+    return vectors, meta
+
+
+def _save_embedding_index(course_dir, vectors, meta):
+    vectors_path = os.path.join(course_dir, VECTORS_NAME)
+    meta_path = os.path.join(course_dir, META_NAME)
+    with open(vectors_path + ".tmp", "wb") as f:
+        np.save(f, vectors)
+    with open(meta_path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False)
+    # Vectors first: a crash in between leaves a length mismatch, which load treats as empty
+    os.replace(vectors_path + ".tmp", vectors_path)
+    os.replace(meta_path + ".tmp", meta_path)
+
+
+def update_embedding_index(course_dir):
+    """
+    Brings the course's vectors in line with its sidecars. Lectures whose
+    sidecar is unchanged (size + mtime) are not even re-read; within changed
+    lectures only sections with new text are embedded.
+
+    Returns:
+        tuple: (vectors, meta)
+    """
+    vectors, meta = load_embedding_index(course_dir)
+    by_hash = {unit["hash"]: i for i, unit in enumerate(meta["units"])}
+    old_rows = {}
+    for i, unit in enumerate(meta["units"]):
+        old_rows.setdefault(unit["lecture"], []).append(i)
+
+    units, rows, lectures = [], [], {}
+    new_units = []
+    for lecture in indexed_lectures(course_dir):
+        try:
+            st = os.stat(os.path.join(course_dir, lecture, SIDECAR_NAME))
+        except OSError:
+            continue
+        stamp = [st.st_size, st.st_mtime_ns]
+        lectures[lecture] = stamp
+        if meta["lectures"].get(lecture) == stamp:
+            for i in old_rows.get(lecture, []):
+                units.append(meta["units"][i])
+                rows.append(i)
+            continue
+        for unit in section_units(course_dir, lecture):
+            units.append(unit)
+            rows.append(by_hash.get(unit["hash"]))
+            if rows[-1] is None:
+                new_units.append(len(units) - 1)
+
+    with span("embed.sections", sections=len(new_units), total=len(units)):
+        fresh = embed_texts([units[i]["text"] for i in new_units])
+
+    dim = fresh.shape[1] if len(fresh) else (vectors.shape[1] if vectors.size else 0)
+    result = np.zeros((len(units), dim), dtype=np.float32)
+    fresh_rows = dict(zip(new_units, range(len(new_units))))
+    for i, row in enumerate(rows):
+        result[i] = fresh[fresh_rows[i]] if row is None else vectors[row]
+
+    meta = {"model": _model_fingerprint(), "lectures": lectures, "units": units}
+    _save_embedding_index(course_dir, result, meta)
+    print(f"[EMBED] {len(new_units)} sections embedded, {len(units) - len(new_units)} reused")
+    return result, meta
+
+
+def select_sections(vectors, meta, token_budget, count_tokens, exam_boost=EXAM_BOOST):
+    """
+    Picks sections by centrality (cosine similarity to the course centroid)
+    plus a boost for exam alerts and questions, skipping near-duplicates and
+    any section that no longer fits in `token_budget`. The budget is checked
+    on the exact text returned, so the result always fits.
+
+    Returns:
+        str: selected sections grouped by lecture, in lecture order
+    """
+    if len(vectors) == 0:
+        return ""
+
+    centroid = vectors.mean(axis=0)
+    centroid /= np.linalg.norm(centroid) or 1.0
+    scores = vectors @ centroid
+    scores += np.array([exam_boost if u["section"] in EXAM_SECTIONS else 0.0 for u in meta["units"]])
+
+    def render(chosen):
+        blocks = []
+        current = None
+        for i in sorted(chosen, key=lambda i: (meta["units"][i]["lecture"], meta["units"][i]["chunk"])):
+            unit = meta["units"][i]
+            if unit["lecture"] != current:
+                current = unit["lecture"]
+                blocks.append(f"## {current}")
+            blocks.append(unit["text"])
+        return "\n\n".join(blocks)
+
+    chosen = []
+    used = 0
+    for i in np.argsort(-scores):
+        if chosen and float(np.max(vectors[chosen] @ vectors[i])) >= DUPLICATE_SIMILARITY:
+            continue
+        cost = count_tokens(meta["units"][i]["text"]) + 8  # Separators and a possible lecture heading
+        if used + cost > token_budget:
+            continue  # A smaller section further down may still fit
+        chosen.append(int(i))
+        used += cost
+
+    text = render(chosen)
+    # Exact check on the final text; drop the lowest-scored picks if estimates were off
+    while chosen and count_tokens(text) > token_budget:
+        chosen.pop()
+        text = render(chosen)
+    return text
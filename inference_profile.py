@@ -0,0 +1,332 @@
+# inference_profile.py
+#
+# Per-machine engine settings. The llama.cpp and Whisper defaults (half the
+# cores, default batch, 3 Whisper threads) are a guess that is far off on both
+# small laptops and big servers. A calibration run measures a few thread and
+# batch combinations for both engines on this host and saves the fastest to
+# inference_profile.json; mistral_notes (whose model revision_generator shares) and whisper_offline
+# read it at import, so every run afterwards uses the tuned values.
+#
+#   python inference_profile.py                       # calibrate both engines
+#   python inference_profile.py --audio lecture.mp3   # time Whisper on real speech
+#   python inference_profile.py --stub                # stand-in engines (checks the run itself)
+#   python inference_profile.py --show
+#
+# A profile is only used on the machine it was measured on (same CPU count and
+# architecture) and for the model it was measured with.
+
+import argparse
+import json
+import os
+import platform
+import tempfile
+import time
+from datetime import datetime
+
+PROFILE_PATH = os.environ.get(
+    "LECTURE_STUDIO_PROFILE",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "inference_profile.json")
+)
+
+LLM_BATCHES = (128, 256, 512, 1024)  # n_batch candidates; 512 is llama.cpp's default
+LLM_PROMPT_TOKENS = 512              # Prompt evaluated per measurement
+LLM_GEN_TOKENS = 32                  # Tokens generated per measurement
+WHISPER_THREADS = (1, 2, 3, 4, 6, 8) # Threads per Whisper worker; workers fill the remaining cores
+WHISPER_SAMPLE_MIN = 4.0             # Audio used to time Whisper
+WHISPER_WINDOW_SEC = 30              # Window size for the timing runs; workers are capped at the window count
+WHISPER_WORKER_MB = 2048             # RAM per Whisper worker (medium int8 model plus decoding buffers)
+
+_profile = None
+
+
+def host_fingerprint():
+    return {"cpus": os.cpu_count(), "machine": platform.machine()}
+
+
+def load_profile(path=None):
+    """The saved profile if it was measured on this host, else {}. Read once per process."""
+    global _profile
+    if _profile is not None and path is None:
+        return _profile
+    profile = {}
+    path = path or PROFILE_PATH
+    if os.path.exists(path):
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                profile = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"[PROFILE] Ignoring unreadable {path}: {e}")
+            profile = {}
+        if profile and profile.get("host") != host_fingerprint():
+            print(f"[PROFILE] {os.path.basename(path)} was measured on another machine; using defaults")
+            profile = {}
+    if path == PROFILE_PATH:
+        _profile = profile
+    return profile
+
+
+def llm_settings(model_path, default_threads):
+    """
+    llama.cpp settings for a model from the profile.
+
+    Returns:
+        tuple: (n_threads, extra Llama params such as n_batch / n_threads_batch / use_mlock)
+    """
+    section = load_profile().get("llm", {})
+    if section.get("model") != os.path.basename(model_path):
+        return default_threads, {}
+    params = {key: section[key] for key in ("n_threads_batch", "n_batch", "use_mlock") if key in section}
+    return section.get("n_threads", default_threads), params
+
+
+def whisper_settings(model_size, compute_type, default_threads):
+    """
+    Whisper settings from the profile.
+
+    Returns:
+        tuple: (cpu_threads per worker, worker count or None for the default)
+    """
+    section = load_profile().get("whisper", {})
+    if section.get("model") != model_size or section.get("compute_type") != compute_type:
+        return default_threads, None
+    return section.get("cpu_threads", default_threads), section.get("workers")
+
+
+def save_profile(profile, path=None):
+    path = path or PROFILE_PATH
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(profile, f, indent=2)
+    os.replace(tmp_path, path)
+    return path
+
+
+# --- Calibration ---
+
+def _thread_candidates(cores):
+    return sorted({max(1, cores // 4), max(1, cores // 2), max(1, 3 * cores // 4), cores})
+
+
+def _time_llm(factory, model_path, n_ctx, text, n_threads, n_threads_batch, n_batch, generate=True):
+    """Prompt-eval and generation speed (tokens/s) of one llama.cpp configuration."""
+    llm = factory(model_path=model_path, n_ctx=n_ctx, n_threads=n_threads, n_threads_batch=n_threads_batch,
+                  n_batch=n_batch, use_mmap=True, verbose=False)
+    try:
+        tokens = llm.tokenize(text.encode("utf-8"), add_bos=True)[:LLM_PROMPT_TOKENS]
+        llm.reset()
+        started = time.perf_counter()
+        llm.eval(tokens)
+        prompt_rate = len(tokens) / (time.perf_counter() - started)
+
+        gen_rate = None
+        if generate:
+            llm.reset()
+            started = time.perf_counter()
+            result = llm("[INST] Summarise in one sentence: " + text[:400] + " [/INST]",
+                         max_tokens=LLM_GEN_TOKENS, temperature=0.0)
+            elapsed = time.perf_counter() - started
+            generated = result.get("usage", {}).get("completion_tokens") or \
+                len(llm.tokenize(result["choices"][0]["text"].encode("utf-8"), add_bos=False))
+            gen_rate = generated / elapsed if generated else None
+    finally:
+        if hasattr(llm, "close"):
+            llm.close()
+    return prompt_rate, gen_rate
+
+
+def _mlock_fits(model_path):
+    # Locking the weights only helps if they fit comfortably and the OS allows it
+    try:
+        import resource
+        import psutil
+    except ImportError:
+        return False
+    size = os.path.getsize(model_path) if os.path.exists(model_path) else 0
+    soft, _ = resource.getrlimit(resource.RLIMIT_MEMLOCK)
+    allowed = soft == resource.RLIM_INFINITY or soft >= size
+    return bool(size) and allowed and psutil.virtual_memory().available > 1.5 * size
+
+
+def calibrate_llm(model_path, n_ctx, factory, text):
+    """
+    Times generation and prompt evaluation for a few thread counts, then
+    n_batch at the best prompt thread count. Generation is memory-bound and
+    often peaks below all cores, so the two thread counts are picked separately.
+    """
+    cores = os.cpu_count() or 2
+    runs = []
+    for threads in _thread_candidates(cores):
+        prompt_rate, gen_rate = _time_llm(factory, model_path, n_ctx, text, threads, threads, 512)
+        runs.append({"n_threads": threads, "n_batch": 512, "prompt_tok_s": round(prompt_rate, 2),
+                     "gen_tok_s": round(gen_rate or 0.0, 2)})
+        print(f"[PROFILE] llama.cpp {threads} threads: {prompt_rate:.1f} prompt tok/s, {gen_rate or 0:.1f} gen tok/s")
+
+    n_threads = max(runs, key=lambda r: r["gen_tok_s"])["n_threads"]
+    best_prompt = max(runs, key=lambda r: r["prompt_tok_s"])
+    n_threads_batch, n_batch, prompt_rate = best_prompt["n_threads"], 512, best_prompt["prompt_tok_s"]
+
+    for batch in LLM_BATCHES:
+        if batch == 512:
+            continue
+        rate, _ = _time_llm(factory, model_path, n_ctx, text, n_threads_batch, n_threads_batch, batch, generate=False)
+        runs.append({"n_threads": n_threads_batch, "n_batch": batch, "prompt_tok_s": round(rate, 2)})
+        print(f"[PROFILE] llama.cpp n_batch={batch}: {rate:.1f} prompt tok/s")
+        if rate > prompt_rate * 1.03:  # Ignore noise-level differences; 512 is the tested default
+            n_batch, prompt_rate = batch, rate
+
+    return {
+        "model": os.path.basename(model_path),
+        "n_threads": n_threads,
+        "n_threads_batch": n_threads_batch,
+        "n_batch": n_batch,
+        "use_mlock": _mlock_fits(model_path),
+        "runs": runs
+    }
+
+
+def _whisper_worker_cap(windows):
+    # More workers than windows are never measured; each worker holds its own model in RAM
+    try:
+        import psutil
+        by_ram = max(1, int(psutil.virtual_memory().available / (1024 * 1024) // WHISPER_WORKER_MB))
+    except ImportError:
+        by_ram = windows
+    return max(1, min(windows, by_ram))
+
+
+def _time_whisper(windows, threads, workers, single_process):
+    """
+    Audio seconds transcribed per second with `workers` x `threads`. Models are
+    loaded by a warm-up round first, so process spawn and model load (paid once
+    per job, not per window) are left out of the steady-state rate.
+    """
+    import whisper_offline
+    from audio_utils import SAMPLE_RATE
+    from worker_pool import WorkerPool
+
+    args = ("ar", whisper_offline.COMPUTE_TYPE, threads, whisper_offline.BEAM_SIZE)
+    audio_sec = sum(len(w) for w in windows) / SAMPLE_RATE
+    if single_process:
+        whisper_offline._transcribe_window(windows[0], *args)  # Warm-up: loads the model in this process
+        started = time.perf_counter()
+        for window in windows:
+            whisper_offline._transcribe_window(window, *args)
+        return audio_sec / (time.perf_counter() - started)
+
+    pool = WorkerPool(workers, whisper_offline._init_worker, (whisper_offline.COMPUTE_TYPE, threads))
+    try:
+        # One window per worker, all submitted at once, so every worker spawns and loads its model
+        warm_up = [pool.submit(whisper_offline._transcribe_window, windows[i], *args) for i in range(workers)]
+        for future in warm_up:
+            future.result()
+        started = time.perf_counter()
+        for future in [pool.submit(whisper_offline._transcribe_window, window, *args) for window in windows]:
+            future.result()
+        return audio_sec / (time.perf_counter() - started)
+    finally:
+        pool.shutdown(wait=True)
+
+
+def calibrate_whisper(audio_path, single_process=False):
+    """
+    Times transcription of the sample for each threads-per-worker count, with
+    workers filling the cores (capped by the sample's windows and by RAM),
+    and keeps the highest audio seconds per second.
+    """
+    import whisper_offline
+    from audio_utils import SAMPLE_RATE, decode_audio
+
+    pcm = decode_audio(audio_path)
+    step = WHISPER_WINDOW_SEC * SAMPLE_RATE
+    windows = [pcm[i:i + step] for i in range(0, len(pcm), step)]
+    cap = _whisper_worker_cap(len(windows))
+    cores = os.cpu_count() or 2
+    runs = []
+    for threads in WHISPER_THREADS:
+        if threads > cores:
+            break
+        workers = 1 if single_process else min(max(1, cores // threads), cap)
+        rate = _time_whisper(windows, threads, workers, single_process)
+        runs.append({"cpu_threads": threads, "workers": workers, "audio_per_sec": round(rate, 3)})
+        print(f"[PROFILE] Whisper {workers}x{threads} threads: {rate:.2f} s of audio per second")
+
+    best = max(runs, key=lambda r: r["audio_per_sec"])
+    return {
+        "model": whisper_offline.WHISPER_MODEL,
+        "compute_type": whisper_offline.COMPUTE_TYPE,
+        "cpu_threads": best["cpu_threads"],
+        "workers": best["workers"],
+        "runs": runs
+    }
+
+
+def _sample_audio(audio_path, minutes, out_path):
+    """The first `minutes` of a lecture (or synthetic audio) as a WAV file."""
+    from audio_utils import SAMPLE_RATE, decode_audio, write_wav
+    if audio_path is None:
+        from benchmark import synthetic_audio
+        return synthetic_audio(out_path, minutes)
+    return write_wav(out_path, decode_audio(audio_path)[:int(minutes * 60 * SAMPLE_RATE)])
+
+
+def main():
+    import mistral_notes
+
+    parser = argparse.ArgumentParser(description="Measure engine settings for this machine and save a profile.")
+    parser.add_argument("--model", default=mistral_notes.MODEL_PATH, help="GGUF model to calibrate")
+    parser.add_argument("--audio", help="Lecture audio to time Whisper on (default: synthetic audio)")
+    parser.add_argument("--minutes", type=float, default=WHISPER_SAMPLE_MIN, help="Audio sample length")
+    parser.add_argument("--skip-llm", action="store_true")
+    parser.add_argument("--skip-whisper", action="store_true")
+    parser.add_argument("--stub", action="store_true", help="Use the benchmark stand-in engines")
+    parser.add_argument("--output", default=PROFILE_PATH, help="Profile path")
+    parser.add_argument("--show", action="store_true", help="Print the saved profile and exit")
+    args = parser.parse_args()
+
+    if args.show:
+        profile = load_profile(args.output)
+        print(json.dumps(profile, indent=2) if profile else "[PROFILE] No profile for this machine")
+        return
+
+    llm_factory = None
+    if args.stub:
+        import benchmark
+        import whisper_offline
+        llm_factory = benchmark.StubLlama
+        whisper_offline.set_whisper_factory(benchmark.StubWhisperModel)
+    elif not args.skip_llm:
+        from llama_cpp import Llama as llm_factory
+
+    model_path = os.path.abspath(args.model)
+    audio_path = os.path.abspath(args.audio) if args.audio else None
+    output = os.path.abspath(args.output)
+    profile = load_profile(output)  # Keep the section that isn't re-measured
+    profile.update({"host": host_fingerprint(), "created": datetime.now().isoformat(timespec="seconds")})
+
+    # Scratch directory so checkpoints and caches from the timing runs are thrown away
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as scratch:
+        os.chdir(scratch)
+        try:
+            if not args.skip_llm:
+                from benchmark import synthetic_transcript
+                profile["llm"] = calibrate_llm(model_path, mistral_notes.CTX_SIZE, llm_factory,
+                                               synthetic_transcript(LLM_PROMPT_TOKENS))
+            if not args.skip_whisper:
+                sample = _sample_audio(audio_path, args.minutes, os.path.join(scratch, "sample.wav"))
+                profile["whisper"] = calibrate_whisper(sample, single_process=args.stub)
+        finally:
+            os.chdir(cwd)
+
+    save_profile(profile, output)
+    llm, whisper = profile.get("llm"), profile.get("whisper")
+    if llm:
+        print(f"[PROFILE] llama.cpp: {llm['n_threads']} threads, {llm['n_threads_batch']} batch threads, "
+              f"n_batch={llm['n_batch']}, mlock={llm['use_mlock']}")
+    if whisper:
+        print(f"[PROFILE] Whisper: {whisper['workers']} workers x {whisper['cpu_threads']} threads")
+    print(f"[PROFILE] Saved to {output}")
+
+
+if __name__ == "__main__":
+    main()
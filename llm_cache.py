@@ -0,0 +1,169 @@
+# llm_cache.py
+#
+# Content-addressed on-disk cache for LLM outputs. The key is a hash of the model
+# file, the generation parameters and the full prompt, so identical work (re-runs,
+# toggling rerank, regenerating a revision) is answered from disk.
+
+import hashlib
+import json
+import os
+import threading
+from datetime import datetime
+
+CACHE_DIR = os.path.join("Lecture_Outputs", ".llm_cache")
+MAX_CACHE_BYTES = 256 * 1024 * 1024  # LRU eviction above this size
+
+_lock = threading.Lock()
+_stats = {"hits": 0, "misses": 0, "evictions": 0}
+# Running size of each cache dir in this process: walked once, then kept up to date on put.
+# Other processes (parallel workers) also write, so the walk in evict_lru re-syncs it.
+_sizes = {}
+
+
+def _model_fingerprint(model_path):
+    # Path + size + mtime identifies the weights without hashing gigabytes
+    try:
+        st = os.stat(model_path)
+        return [os.path.abspath(model_path), st.st_size, st.st_mtime_ns]
+    except OSError:
+        return [os.path.abspath(model_path), None, None]
+
+
+def make_cache_key(model_path, params, prompt):
+    payload = json.dumps(
+        {"model": _model_fingerprint(model_path), "params": params, "prompt": prompt},
+        sort_keys=True,
+        ensure_ascii=False
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _entry_path(key, cache_dir):
+    return os.path.join(cache_dir, key[:2], f"{key}.json")
+
+
+def cache_get(key, cache_dir=CACHE_DIR):
+    """Returns the cached text for a key, or None. A hit refreshes its LRU position."""
+    path = _entry_path(key, cache_dir)
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            entry = json.load(f)
+        os.utime(path)  # mtime doubles as last-access time for LRU
+    except (OSError, ValueError):
+        with _lock:
+            _stats["misses"] += 1
+        return None
+
+    with _lock:
+        _stats["hits"] += 1
+    return entry["text"]
+
+
+def _walk_entries(cache_dir):
+    # (mtime, size, path) of every cache entry
+    entries = []
+    for root, _, files in os.walk(cache_dir):
+        for name in files:
+            if not name.endswith(".json"):
+                continue
+            path = os.path.join(root, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, path))
+    return entries
+
+
+def cache_put(key, text, cache_dir=CACHE_DIR, max_bytes=MAX_CACHE_BYTES):
+    """Stores text under a key (atomically), then evicts old entries if over the cap."""
+    path = _entry_path(key, cache_dir)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({"text": text, "created": datetime.now().isoformat()}, f, ensure_ascii=False)
+    size = os.path.getsize(tmp_path)
+    try:
+        old_size = os.path.getsize(path)
+    except OSError:
+        old_size = 0
+    os.replace(tmp_path, path)
+
+    # Only walk the directory (to evict) once the cheap running total passes the cap
+    size_key = os.path.abspath(cache_dir)
+    with _lock:
+        known = size_key in _sizes
+    if not known:
+        total = sum(size for _, size, _ in _walk_entries(cache_dir))
+        with _lock:
+            _sizes[size_key] = total
+    else:
+        with _lock:
+            _sizes[size_key] += size - old_size
+            total = _sizes[size_key]
+    if total > max_bytes:
+        evict_lru(cache_dir, max_bytes)
+
+
+def evict_lru(cache_dir=CACHE_DIR, max_bytes=MAX_CACHE_BYTES):
+    """Deletes least recently used entries until the cache fits in max_bytes."""
+    entries = _walk_entries(cache_dir)
+    total = sum(size for _, size, _ in entries)
+
+    if total <= max_bytes:
+        with _lock:
+            _sizes[os.path.abspath(cache_dir)] = total
+        return 0
+
+    removed = 0
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+        except OSError:
+            continue
+        total -= size
+        removed += 1
+
+    with _lock:
+        _sizes[os.path.abspath(cache_dir)] = total
+        _stats["evictions"] += removed
+    return removed
+
+
+def cached_completion(model_path, params, prompt, generate, cache_dir=CACHE_DIR, is_complete=None):
+    """
+    Returns the cached output for (model, params, prompt), or calls `generate()`
+    and caches its result. Empty results are not cached, nor are results for
+    which `is_complete()` returns False (e.g. generation stopped early).
+    """
+    key = make_cache_key(model_path, params, prompt)
+    text = cache_get(key, cache_dir)
+    if text is not None:
+        return text
+
+    text = generate()
+    if text and (is_complete is None or is_complete()):
+        cache_put(key, text, cache_dir)
+    return text
+
+
+def cache_stats(cache_dir=CACHE_DIR):
+    """Hit/miss/eviction counters for this process plus current on-disk usage."""
+    entries = 0
+    size = 0
+    for root, _, files in os.walk(cache_dir):
+        for name in files:
+            if name.endswith(".json"):
+                entries += 1
+                size += os.path.getsize(os.path.join(root, name))
+
+    with _lock:
+        stats = dict(_stats)
+    lookups = stats["hits"] + stats["misses"]
+    stats["hit_rate"] = round(stats["hits"] / lookups, 3) if lookups else 0.0
+    stats["entries"] = entries
+    stats["bytes"] = size
+    return stats
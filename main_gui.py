@@ -1,21 +1,38 @@
 # main_gui.py (Revised with Language Selector for Whisper + Mistral Shutdown Awareness)
 
 import os
+import queue
 import threading
+import time
 import tkinter as tk
 from tkinter import filedialog, messagebox
-from whisper_offline import transcribe_audio, kill_whisper, set_abort_flag
-from mistral_notes import generate_notes_from_transcript
+from whisper_offline import kill_whisper, set_abort_flag, LANGUAGE_CODE_MAP
+from pipeline import run_streaming_pipeline
+from parallel_notes import kill_note_workers
 from revision_generator import run_revision_pipeline
-from output_manager import save_transcript
+from output_manager import create_output_paths, course_output_dir, save_transcript
+from tracing import set_debug
+from progress import JobProgress
+
+SHUTDOWN_GRACE_SEC = 3  # Max wait for partial notes to be saved on emergency stop
+EVENT_POLL_MS = 100     # How often the Tk loop drains worker events
+MAX_CONCURRENT_JOBS = 2 # Jobs share the CPU and the model; more just slows each one down
+
+# Worker threads never touch Tk. They post (job_id, kind, payload) events to a
+# queue that the main loop drains with after(): "status" (msg, color),
+# "progress" (pipeline progress dict), "info"/"error" (title, message), "done".
 
 class LectureStudioGUI:
     def __init__(self, root):
         self.root = root
         self.root.title("Lecture Studio 2.0")
-        self.root.geometry("500x550")
+        self.root.geometry("500x650")
         self.root.protocol("WM_DELETE_WINDOW", self.shutdown)
 
+        self.events = queue.Queue()
+        self.jobs = {}          # job_id -> {"name", "thread", "progress", "label"}
+        self.next_job_id = 1
+
         self.exit_button = tk.Button(root, text="🛑 Emergency Stop", fg="white", bg="red", command=self.shutdown)
         self.exit_button.pack(pady=5)
 
@@ -52,6 +69,12 @@ class LectureStudioGUI:
         self.status_label = tk.Label(root, text="Waiting for input...", fg="blue")
         self.status_label.pack(pady=10)
 
+        # One line per running job: status, throughput and ETA
+        self.jobs_frame = tk.LabelFrame(root, text="⏱ Jobs")
+        self.jobs_frame.pack(fill="x", padx=10, pady=5)
+
+        self.root.after(EVENT_POLL_MS, self.drain_events)
+
     def browse_audio(self):
         file_path = filedialog.askopenfilename(filetypes=[("MP3 files", "*.mp3")])
         if file_path:
@@ -62,49 +85,122 @@ class LectureStudioGUI:
             self.audio_path_label.config(text="No file selected")
 
     def update_status(self, msg, color="black"):
+        # Main thread only; workers post "status" events instead
         self.status_label.config(text=msg, fg=color)
-        self.root.update_idletasks()
 
-    def run_pipeline_threaded(self):
-        thread = threading.Thread(target=self.run_pipeline)
+    # --- Jobs and events ---
+
+    def post(self, job_id, kind, *payload):
+        """Thread-safe: queues an event for the Tk loop."""
+        self.events.put((job_id, kind, payload))
+
+    def start_job(self, name, target, *args):
+        running = sum(job["thread"].is_alive() for job in self.jobs.values())
+        if running >= MAX_CONCURRENT_JOBS:
+            messagebox.showwarning("Busy", f"{running} jobs are already running. Please wait for one to finish.")
+            return None
+        job_id = self.next_job_id
+        self.next_job_id += 1
+        label = tk.Label(self.jobs_frame, text=f"{name}: starting...", anchor="w", justify="left")
+        label.pack(fill="x", padx=5)
+        thread = threading.Thread(target=target, args=(job_id, *args), daemon=True)
+        self.jobs[job_id] = {"name": name, "thread": thread, "progress": JobProgress(name), "label": label,
+                             "status": "", "finished": None}
         thread.start()
+        return job_id
 
-    def run_pipeline(self):
-        course = self.course_entry.get().strip()
-        lecture = self.lecture_entry.get().strip()
-        lang_mode = self.lang_var.get()
+    def drain_events(self):
+        try:
+            while True:
+                job_id, kind, payload = self.events.get_nowait()
+                self.handle_event(job_id, kind, payload)
+        except queue.Empty:
+            pass
+        self.refresh_jobs()
+        self.root.after(EVENT_POLL_MS, self.drain_events)
+
+    def handle_event(self, job_id, kind, payload):
+        job = self.jobs.get(job_id)
+        if kind == "status":
+            msg, color = payload
+            self.update_status(msg if len(self.jobs) < 2 or not job else f"[{job['name']}] {msg}", color)
+            if job:
+                job["status"] = msg
+        elif kind == "progress" and job:
+            job["progress"].update(payload[0])
+        elif kind == "info":
+            messagebox.showinfo(*payload)
+        elif kind == "error":
+            messagebox.showerror(*payload)
+        elif kind == "done" and job:
+            job["finished"] = time.monotonic()
+
+    def refresh_jobs(self):
+        now = time.monotonic()
+        for job_id, job in list(self.jobs.items()):
+            if job["finished"] is not None:
+                if now - job["finished"] > 30:
+                    job["label"].destroy()  # Keep finished jobs visible for a while
+                    del self.jobs[job_id]
+                    continue
+                text = f"{job['name']}: {job['status']}"
+            else:
+                text = f"{job['name']}: {job['progress'].summary_line()}"
+            if job["label"].cget("text") != text:
+                job["label"].config(text=text)
+
+    # --- Pipeline ---
 
-        if not course or not lecture or not getattr(self, "audio_path", None):
+    def run_pipeline_threaded(self):
+        # Read the form here, on the main thread; the worker only gets plain values
+        params = {
+            "course": self.course_entry.get().strip(),
+            "lecture": self.lecture_entry.get().strip(),
+            "lang_mode": self.lang_var.get(),
+            "audio_path": getattr(self, "audio_path", None),
+            "rerank": self.rerank_var.get(),
+            "revision": self.revision_var.get(),
+            "include_exam": self.exam_notes_var.get(),
+            "debug": self.debug_mode_var.get()
+        }
+        if not params["course"] or not params["lecture"] or not params["audio_path"]:
             messagebox.showwarning("Missing Info", "Please provide course name, lecture title, and audio file.")
             return
+        set_debug(params["debug"])
+        self.start_job(f"{params['course']} / {params['lecture']}", self.run_pipeline, params)
 
+    def run_pipeline(self, job_id, params):
+        status = lambda msg, color="black": self.post(job_id, "status", msg, color)
         try:
-            self.update_status("🎧 Transcribing audio with Whisper...", "green")
-            ar_text, en_text, _ = transcribe_audio(self.audio_path, lang_mode)
-
-            self.update_status("💾 Saving transcripts...", "black")
-            save_transcript(ar_text, os.path.join("Lecture_Outputs", course.replace(" ", "_")))
-
-            self.update_status("🧠 Generating notes with Mistral...", "purple")
-            generate_notes_from_transcript(
-                ar_text,
-                course,
-                lecture,
-                rerank=self.rerank_var.get(),
-                include_exam=self.exam_notes_var.get(),
-                gui_callback=self.update_status,
-                debug=self.debug_mode_var.get()
+            # Whisper and Mistral run concurrently; notes appear as chunks are transcribed
+            status("🎧 Transcribing and generating notes...", "green")
+            transcript_text, _ = run_streaming_pipeline(
+                params["audio_path"],
+                params["lang_mode"],
+                params["course"],
+                params["lecture"],
+                rerank=params["rerank"],
+                include_exam=params["include_exam"],
+                gui_callback=status,
+                debug=params["debug"],
+                progress_callback=lambda event: self.post(job_id, "progress", event)
             )
 
-            if self.revision_var.get():
-                self.update_status("📘 Creating revision summary...", "blue")
-                run_revision_pipeline(os.path.join("Lecture_Outputs", course.replace(" ", "_")))
+            status("💾 Saving transcripts...", "black")
+            lecture_dir = create_output_paths("Lecture_Outputs", params["course"], params["lecture"])
+            save_transcript(transcript_text, lecture_dir, lang=LANGUAGE_CODE_MAP.get(params["lang_mode"], "ar"))
 
-            self.update_status("✅ All done!", "green")
-            messagebox.showinfo("Done", "Lecture processed and notes saved successfully.")
+            if params["revision"]:
+                status("📘 Creating revision summary...", "blue")
+                run_revision_pipeline(os.path.dirname(lecture_dir))
+
+            status("✅ All done!", "green")
+            self.post(job_id, "info", "Done", f"{params['lecture']}: lecture processed and notes saved successfully.")
         except Exception as e:
-            self.update_status("❌ Error during processing", "red")
-            messagebox.showerror("Error", str(e))
+            status("❌ Error during processing", "red")
+            self.post(job_id, "error", "Error", str(e))
+        finally:
+            self.post(job_id, "done")
 
     def run_revision(self):
         course_name = self.course_entry.get().strip()
@@ -112,22 +208,36 @@ class LectureStudioGUI:
             messagebox.showwarning("Missing Course", "Please enter a course name to generate revision.")
             return
 
-        course_dir = os.path.join("Lecture_Outputs", course_name.replace(" ", "_").lower())
+        course_dir = course_output_dir("Lecture_Outputs", course_name)
         if not os.path.exists(course_dir) or not os.listdir(course_dir):
             messagebox.showinfo("No Data", f"There are no lecture notes yet for '{course_name}'.\nMidterm revision cannot be generated.")
             return
 
+        self.start_job(f"{course_name} / revision", self.run_revision_job, course_dir)
+
+    def run_revision_job(self, job_id, course_dir):
         try:
+            self.post(job_id, "status", "📘 Creating revision summary...", "blue")
             revision_path = run_revision_pipeline(course_dir)
-            messagebox.showinfo("Revision Complete", f"Midterm revision generated:\n{revision_path}")
+            self.post(job_id, "status", "✅ Revision ready", "green")
+            self.post(job_id, "info", "Revision Complete", f"Midterm revision generated:\n{revision_path}")
         except Exception as e:
-            messagebox.showerror("Error", f"An error occurred while generating revision:\n{str(e)}")
+            self.post(job_id, "status", "❌ Error during revision", "red")
+            self.post(job_id, "error", "Error", f"An error occurred while generating revision:\n{str(e)}")
+        finally:
+            self.post(job_id, "done")
 
     def shutdown(self):
         print("[SHUTDOWN] User requested shutdown.")
         try:
-            set_abort_flag()      # Signal Mistral to exit
+            set_abort_flag()      # Signal Mistral to exit (checked after every token)
             kill_whisper()        # Stop Whisper if it's still running
+            kill_note_workers()   # Stop parallel Mistral workers, if any
+            # Give the workers a moment to flush partial notes before exiting
+            deadline = time.monotonic() + SHUTDOWN_GRACE_SEC
+            for job in self.jobs.values():
+                if job["thread"].is_alive():
+                    job["thread"].join(timeout=max(0.0, deadline - time.monotonic()))
             with open("shutdown_log.txt", "a", encoding="utf-8") as log:
                 log.write("[SHUTDOWN] Triggered by user. All processes terminated.\n")
             os._exit(0)
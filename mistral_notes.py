@@ -1,25 +1,45 @@
 # mistral_notes.py (Updated with Translation Option + Debug Mode + CLI Progress Bar)
 
 import os
-from llama_cpp import Llama
+import time
+from model_registry import use_model, inference_lock
+from prefix_cache import stream_with_prefix
+from llm_cache import cached_completion
 from utils import (
-    split_into_chunks,
+    split_into_token_chunks,
+    clip_to_token_budget,
     score_chunk_for_importance,
     extract_key_summary,
+    build_prompt_prefix,
     prepare_contextual_prompt
 )
-from output_manager import save_notes_markdown
+from output_manager import create_output_paths, save_notes_markdown, save_chunk_notes, format_notes
+from notes_index import save_notes_sidecar
+from notes_journal import NotesJournal, settings_key, chain_hash
 from tqdm import tqdm  # NEW: Progress bar for terminal
 from whisper_offline import should_abort
+from tracing import span, record_span, debug_log, set_debug, trace_to
+from inference_profile import llm_settings
+from note_grammar import notes_grammar, structured_max_tokens, compile_grammar, STOP_SEQUENCES
+from transcript_cleanup import clean_transcript, report_cleanup
 
 
 # Model configuration
 MODEL_PATH = "mistral-7b-instruct-v0.1.Q4_K_M.gguf"
 CTX_SIZE = 4096
 MAX_TOKENS = 1536
+SUMMARY_TOKENS = 256        # Reserved in every prompt for the previous chunk's summary
+CHUNK_OVERLAP_TOKENS = 0    # Trailing transcript tokens repeated at the start of the next chunk
+SAFETY_TOKENS = 16          # Slack for tokenizer merges at sentence joins
+# Threads and extra Llama params (n_batch, ...) come from the calibrated profile if there is one
+LLM_THREADS, LLM_PARAMS = llm_settings(MODEL_PATH, max(1, (os.cpu_count() or 2) // 2))
+PARALLEL_WORKERS = 0        # Model worker processes for parallel mode: 0 = sequential, -1 = size to machine
+STRUCTURED_NOTES = True     # Grammar-constrained sections with capped bullets (see note_grammar); False = free-form
+TRANSCRIPT_CLEANUP = True   # Collapse Whisper repetition loops and normalise text before chunking
 
-# Load the model once
-llm = Llama(model_path=MODEL_PATH, n_ctx=CTX_SIZE)
+OUTPUT_DIR = "Lecture_Outputs"
+
+# The model itself is loaded lazily and shared through model_registry
 
 def generate_notes_from_transcript(
     transcript_text,
@@ -27,6 +47,7 @@ def generate_notes_from_transcript(
     lecture,
     rerank=True,
     include_exam=True,
+    gui_callback=None,
     debug=False  # Optional debugging toggle
 ):
     """
@@ -38,14 +59,266 @@ def generate_notes_from_transcript(
         lecture (str): Lecture title for saving output
         rerank (bool): Whether to sort notes by importance
         include_exam (bool): Include exam alerts and questions
+        gui_callback (callable): Optional status callback (message, color)
         debug (bool): Enable debug messages during processing
 
     Returns:
         list: List of note dictionaries with content and scores
     """
-    chunks = split_into_chunks(transcript_text)
+    with trace_to(create_output_paths(OUTPUT_DIR, course, lecture)):
+        count_tokens = load_token_counter()
+        if TRANSCRIPT_CLEANUP:
+            with span("cleanup", transcript_chars=len(transcript_text)) as attrs:
+                transcript_text, stats = clean_transcript(transcript_text, count_tokens)
+                attrs.update(stats)
+            print(report_cleanup(stats))
+        budget = chunk_token_budget(count_tokens, include_exam)
+        with span("chunking", transcript_chars=len(transcript_text), token_budget=budget) as attrs:
+            chunks = split_into_token_chunks(transcript_text, budget, count_tokens, CHUNK_OVERLAP_TOKENS)
+            attrs["chunks"] = len(chunks)
+
+        return generate_notes_from_chunks(
+            chunks, course, lecture,
+            rerank=rerank,
+            include_exam=include_exam,
+            gui_callback=gui_callback,
+            debug=debug,
+            count_tokens=count_tokens
+        )
+
+
+def generate_notes_from_chunks(
+    chunks,
+    course,
+    lecture,
+    rerank=True,
+    include_exam=True,
+    gui_callback=None,
+    debug=False,
+    count_tokens=None,
+    workers=None,
+    progress_callback=None,
+    source_complete=None
+):
+    """
+    Generates notes for an iterable of transcript chunks, which may still be
+    growing (e.g. chunks streamed from transcription). Tokens are streamed into
+    notes.md as they are generated, so an emergency stop leaves usable partial notes.
+    Finished chunks are journaled; a re-run skips them and resumes at the first
+    missing chunk.
+
+    With `workers` (default PARALLEL_WORKERS) other than 0 or 1, chunks run in
+    parallel on model worker processes; see parallel_notes.
+
+    `progress_callback` receives dicts like {"stage": "llm", "chunks_done": 3,
+    "tokens": 812} for throughput displays.
+
+    `source_complete` (optional) tells whether `chunks` ended because the
+    transcript is complete; if it returns False (e.g. transcription failed),
+    the journal is kept so a re-run resumes.
+
+    Returns:
+        list: List of note dictionaries with content and scores
+    """
+    if debug:
+        set_debug(True)
+    count_tokens = count_tokens or load_token_counter()
+    lecture_dir = create_output_paths(OUTPUT_DIR, course, lecture)
+    workers = PARALLEL_WORKERS if workers is None else workers
+    parallel = workers not in (0, 1)
     notes = []
     summaries = []
+    journal = NotesJournal(lecture_dir, settings_key(MODEL_PATH, {
+        "n_ctx": CTX_SIZE,
+        "max_tokens": note_output(include_exam)[0],
+        "structured": STRUCTURED_NOTES,
+        "summary_tokens": SUMMARY_TOKENS,
+        "include_exam": include_exam,
+        "context": "transcript_tail" if parallel else "previous_summary"
+    }))
+
+    with trace_to(lecture_dir):
+        if parallel:
+            # Imported here: parallel_notes imports this module
+            from parallel_notes import generate_chunk_notes_parallel
+            generate_chunk_notes_parallel(chunks, notes, include_exam, count_tokens, lecture_dir,
+                                          workers, gui_callback, journal, progress_callback)
+        else:
+            writer = StreamingNotesWriter(lecture_dir, gui_callback, progress_callback)
+            try:
+                _generate_chunk_notes(chunks, notes, summaries, include_exam, count_tokens, writer, journal)
+            finally:
+                writer.close()
+        if not should_abort() and (source_complete is None or source_complete()):
+            journal.remove()
+
+        # Sort chunks if re-ranking is enabled
+        if rerank:
+            notes = sorted(notes, key=lambda n: n["score"], reverse=True)
+
+        # Store the notes (exporting notes.md), then the structured sidecar and course index
+        save_chunk_notes(notes, lecture_dir)
+        with span("write.sidecar", chunks=len(notes)):
+            save_notes_sidecar(notes, lecture_dir)
+
+    return notes
+
+
+class StreamingNotesWriter:
+    """
+    Keeps notes.md current while the model is still writing: finished chunks
+    are rewritten in full, tokens of the chunk in progress are appended and
+    flushed as they arrive.
+    """
+
+    GUI_INTERVAL = 0.5  # Seconds between token progress updates sent to the GUI
+
+    def __init__(self, lecture_dir, gui_callback=None, progress_callback=None):
+        self.path = os.path.join(lecture_dir, "notes.md")
+        self.gui_callback = gui_callback
+        self.progress_callback = progress_callback
+        self.file = None
+        self.index = None
+        self.tokens = 0
+        self.total_tokens = 0
+        self.chunks_done = 0
+        self.last_update = 0.0
+
+    def start_chunk(self, index, notes):
+        self.close()
+        save_notes_markdown(format_notes(notes), os.path.dirname(self.path))
+        self.file = open(self.path, "a", encoding="utf-8")
+        self.file.write(f"{chr(10) * 2 if notes else ''}## Chunk {index}\n\n")
+        self.file.flush()
+        self.index = index
+        self.tokens = 0
+
+    def restore_chunk(self, index, notes):
+        """Adds a chunk taken from the journal (already in `notes`) to notes.md."""
+        self.index = index
+        self.finish_chunk(notes)
+
+    def write(self, piece):
+        self.file.write(piece)
+        self.file.flush()
+        self.tokens += 1
+        self.total_tokens += 1
+        now = time.monotonic()
+        if now - self.last_update >= self.GUI_INTERVAL:
+            self.last_update = now
+            if self.gui_callback:
+                self.gui_callback(f"🧠 Chunk {self.index}: {self.tokens} tokens", "purple")
+            self._report()
+
+    def finish_chunk(self, notes):
+        self.close()
+        save_notes_markdown(format_notes(notes), os.path.dirname(self.path))
+        self.chunks_done += 1
+        if self.gui_callback:
+            self.gui_callback(f"🧠 Notes ready for chunk {self.index}", "purple")
+        self._report()
+
+    def _report(self):
+        if self.progress_callback:
+            self.progress_callback({"stage": "llm", "chunk": self.index, "chunks_done": self.chunks_done,
+                                    "tokens": self.total_tokens})
+
+    def close(self):
+        if self.file:
+            self.file.close()
+            self.file = None
+
+
+def load_token_counter():
+    """
+    Returns a function counting model tokens in a string.
+    Uses a vocab-only model instance, so no weights are loaded for chunking.
+    """
+    with use_model(MODEL_PATH, CTX_SIZE, vocab_only=True) as vocab:
+        return lambda text: len(vocab.tokenize(text.encode("utf-8"), add_bos=False))
+
+
+def note_output(include_exam=True):
+    """
+    Generation settings for chunk notes.
+
+    Returns:
+        tuple: (max_tokens, GBNF grammar text or None for free-form output)
+    """
+    if STRUCTURED_NOTES:
+        return structured_max_tokens(include_exam), notes_grammar(include_exam)
+    return MAX_TOKENS, None
+
+
+def chunk_token_budget(count_tokens, include_exam=True):
+    """
+    Transcript tokens that fit in one prompt: the context window minus the
+    generation length, the fixed prompt text and the reserved summary budget.
+    Structured notes have a smaller generation cap, which leaves more room.
+    """
+    overhead = count_tokens(prepare_contextual_prompt(
+        "",
+        previous_chunk="-",
+        include_exam=include_exam,
+        translate_to_english=True
+    ))
+    budget = CTX_SIZE - note_output(include_exam)[0] - overhead - SUMMARY_TOKENS - SAFETY_TOKENS
+    if budget <= 0:
+        raise ValueError(f"CTX_SIZE={CTX_SIZE} leaves no room for transcript text")
+    return budget
+
+
+def run_model(prompt, prefix, max_tokens=MAX_TOKENS, on_token=None, grammar=None):
+    """
+    Returns the model's output for a prompt, answered from the on-disk cache
+    when the same model, settings and prompt were seen before.
+
+    The model is only loaded (through the shared registry) on a cache miss.
+    Output is streamed: `on_token` gets each piece as it is generated and the
+    abort flag is checked after every token, returning the partial text on stop.
+    `grammar` is GBNF text constraining the output (see note_grammar).
+    """
+    options = {"max_tokens": max_tokens, "stop": STOP_SEQUENCES}
+    if grammar:
+        options["grammar"] = compile_grammar(grammar)
+
+    def generate():
+        pieces = []
+        with use_model(MODEL_PATH, CTX_SIZE, n_threads=LLM_THREADS, **LLM_PARAMS) as llm, inference_lock(llm), \
+                span("llm.generate") as attrs:
+            attrs["prompt_tokens"] = len(llm.tokenize(prompt.encode("utf-8"), add_bos=True))
+            started = time.perf_counter()
+            first_token_at = None
+            for piece in stream_with_prefix(llm, prefix, prompt, **options):
+                if first_token_at is None:
+                    # Time to first token is dominated by prompt evaluation
+                    first_token_at = time.perf_counter()
+                    record_span("llm.prompt_eval", first_token_at - started, prompt_tokens=attrs["prompt_tokens"])
+                pieces.append(piece)
+                if on_token:
+                    on_token(piece)
+                if should_abort():
+                    print("[MISTRAL] Stopping generation mid-chunk due to shutdown.")
+                    break
+            attrs["completion_tokens"] = len(pieces)
+            if first_token_at and len(pieces) > 1:
+                attrs["tokens_per_sec"] = round(len(pieces) / (time.perf_counter() - first_token_at), 2)
+        return "".join(pieces).strip()
+
+    params = {"n_ctx": CTX_SIZE, "max_tokens": max_tokens, "stop": STOP_SEQUENCES, "grammar": grammar}
+    # Partial output from a stopped generation is never cached
+    return cached_completion(MODEL_PATH, params, prompt, generate, is_complete=lambda: not should_abort())
+
+
+def _generate_chunk_notes(chunks, notes, summaries, include_exam, count_tokens, writer=None, journal=None):
+    """
+    Runs the model over each chunk in order, appending to notes and summaries.
+    Chunks already in the journal are taken from it instead of the model.
+    """
+    # Shared system header: evaluated once per model, reused for every chunk
+    prefix = build_prompt_prefix(include_exam=include_exam, translate_to_english=True)
+    max_tokens, grammar = note_output(include_exam)
+    transcript_hash = None
 
     # Wrap loop in tqdm progress bar
     for i, chunk in enumerate(tqdm(chunks, desc="[MISTRAL] Generating Notes", unit="chunk")):
@@ -54,8 +327,16 @@ def generate_notes_from_transcript(
             with open("shutdown_log.txt", "a", encoding="utf-8") as log:
                 log.write(f"[MISTRAL] Aborted during chunk {i+1}.\n")
             break
-        if debug:
-            print(f"[MISTRAL] Processing chunk {i+1}/{len(chunks)}...")
+        transcript_hash = chain_hash(transcript_hash, chunk)
+        entry = journal.lookup(i+1, transcript_hash) if journal else None
+        if entry:
+            debug_log(f"[MISTRAL] Chunk {i+1} restored from journal.")
+            notes.append({"index": i+1, "content": entry["content"], "score": entry["score"]})
+            summaries.append(entry["summary"])
+            if writer:
+                writer.restore_chunk(i+1, notes)  # notes.md of a resumed run includes replayed chunks
+            continue
+        debug_log(f"[MISTRAL] Processing chunk {i+1}...")
 
         # Prepare prompt based on current and previous chunk context
         if i == 0:
@@ -67,6 +348,8 @@ def generate_notes_from_transcript(
             )
         else:
             previous_summary = summaries[-1] if summaries else None
+            if previous_summary:
+                previous_summary = clip_to_token_budget(previous_summary, SUMMARY_TOKENS, count_tokens)
             prompt = prepare_contextual_prompt(
                 chunk,
                 previous_chunk=previous_summary,
@@ -74,27 +357,25 @@ def generate_notes_from_transcript(
                 translate_to_english=True
             )
 
-        # Call the local model with the prepared prompt
-        output = llm(prompt, max_tokens=MAX_TOKENS)
-        result = output["choices"][0].get("text") or output["choices"][0].get("content", "")
-        result = result.strip()
-        if debug:
-            print(f"\n🔹 [CHUNK {i+1} OUTPUT]:\n{result}\n")
-
+        # Call the local model (or the cache) with the prepared prompt
+        if writer:
+            writer.start_chunk(i+1, notes)
+        with span("llm.chunk", chunk=i+1):
+            result = run_model(prompt, prefix, max_tokens, on_token=writer.write if writer else None, grammar=grammar)
+        debug_log(f"\n🔹 [CHUNK {i+1} OUTPUT]:\n{result}\n")
 
         # Score and store the result
-        score = score_chunk_for_importance(result)
-        notes.append({"index": i+1, "content": result, "score": score})
-
-        # Extract a compact summary for linking to next chunk
-        summaries.append(extract_key_summary(result))
+        with span("scoring", chunk=i+1) as attrs:
+            score = score_chunk_for_importance(result)
+            notes.append({"index": i+1, "content": result, "score": score})
 
-    # Sort chunks if re-ranking is enabled
-    if rerank:
-        notes = sorted(notes, key=lambda n: n["score"], reverse=True)
+            # Extract a compact summary for linking to next chunk
+            summaries.append(extract_key_summary(result))
+            attrs["score"] = score
 
-    # Join all notes and export
-    final_output = "\n\n".join([f"## Chunk {n['index']}\n\n{n['content']}" for n in notes])
-    save_notes_markdown([(None, n["content"]) for n in notes], course, lecture)
+        # A chunk cut short by a stop is kept in notes.md but never journaled
+        if journal and not should_abort():
+            journal.record(i+1, transcript_hash, result, score, summaries[-1])
 
-    return notes
+        if writer:
+            writer.finish_chunk(notes)
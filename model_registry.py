@@ -0,0 +1,140 @@
+# model_registry.py
+#
+# One shared, lazily loaded Llama instance per (model path, context size, params).
+# Note generation and revision both borrow models from here instead of each
+# loading their own copy at import time.
+
+import os
+import threading
+from contextlib import contextmanager
+
+# Guards the registry dict itself; each entry has its own locks for loading and inference
+_registry_lock = threading.Lock()
+_models = {}
+
+# Callable building a model from (model_path=..., n_ctx=..., **params); None means llama_cpp.Llama.
+# Swapped out by the benchmark harness to run with stand-in engines.
+_model_factory = None
+
+
+def set_model_factory(factory):
+    """Replaces the Llama constructor used for new loads (None restores llama_cpp.Llama)."""
+    global _model_factory
+    _model_factory = factory
+
+
+def _make_key(model_path, n_ctx, params):
+    return (os.path.abspath(model_path), n_ctx, tuple(sorted(params.items())))
+
+
+def acquire_model(model_path, n_ctx, **params):
+    """
+    Returns the shared Llama instance for these settings, loading it on first use.
+
+    Weights are memory-mapped (use_mmap=True) so the OS page cache backs them.
+    Every acquire must be paired with release_model (or use `use_model`).
+    """
+    key = _make_key(model_path, n_ctx, params)
+
+    with _registry_lock:
+        entry = _models.get(key)
+        if entry is None:
+            entry = {
+                "llm": None,
+                "refs": 0,
+                "load_lock": threading.Lock(),
+                "inference_lock": threading.RLock()
+            }
+            _models[key] = entry
+        entry["refs"] += 1
+
+    # Load outside the registry lock so other models stay available meanwhile
+    with entry["load_lock"]:
+        if entry["llm"] is None:
+            if _model_factory is not None:
+                factory = _model_factory
+            else:
+                from llama_cpp import Llama as factory  # Imported lazily to keep GUI startup fast
+            print(f"[MODEL] Loading {os.path.basename(model_path)} (n_ctx={n_ctx})")
+            load_params = {"use_mmap": True, "verbose": False}
+            load_params.update(params)
+            try:
+                entry["llm"] = factory(model_path=model_path, n_ctx=n_ctx, **load_params)
+            except Exception:
+                with _registry_lock:
+                    entry["refs"] -= 1
+                raise
+    return entry["llm"]
+
+
+def release_model(model_path, n_ctx, **params):
+    """
+    Drops one reference. The model stays loaded until unload_model is called.
+    """
+    key = _make_key(model_path, n_ctx, params)
+    with _registry_lock:
+        entry = _models.get(key)
+        if entry and entry["refs"] > 0:
+            entry["refs"] -= 1
+
+
+@contextmanager
+def use_model(model_path, n_ctx, **params):
+    """
+    Borrows the shared model for the duration of a `with` block.
+    """
+    llm = acquire_model(model_path, n_ctx, **params)
+    try:
+        yield llm
+    finally:
+        release_model(model_path, n_ctx, **params)
+
+
+def inference_lock(llm):
+    """
+    Returns the lock that serialises calls on a shared Llama instance.
+    A llama.cpp context must not be evaluated from two threads at once.
+    """
+    with _registry_lock:
+        for entry in _models.values():
+            if entry["llm"] is llm:
+                return entry["inference_lock"]
+    raise KeyError("Model is not managed by the registry")
+
+
+def unload_model(model_path, n_ctx, force=False, **params):
+    """
+    Frees a loaded model if nobody holds a reference to it (or if force=True).
+
+    Returns:
+        bool: True if the model was unloaded
+    """
+    key = _make_key(model_path, n_ctx, params)
+    with _registry_lock:
+        entry = _models.get(key)
+        if entry is None or (entry["refs"] > 0 and not force):
+            return False
+        del _models[key]
+
+    llm = entry["llm"]
+    entry["llm"] = None
+    if llm is not None:
+        with entry["inference_lock"]:
+            if hasattr(llm, "close"):
+                llm.close()
+    print(f"[MODEL] Unloaded {os.path.basename(model_path)}")
+    return True
+
+
+def unload_all(force=False):
+    """Unloads every idle model (all models if force=True)."""
+    with _registry_lock:
+        keys = list(_models.keys())
+    for model_path, n_ctx, params in keys:
+        unload_model(model_path, n_ctx, force=force, **dict(params))
+
+
+def loaded_models():
+    """Returns (model path, n_ctx, ref count) for each loaded model."""
+    with _registry_lock:
+        return [(key[0], key[1], entry["refs"]) for key, entry in _models.items() if entry["llm"] is not None]
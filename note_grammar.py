@@ -0,0 +1,61 @@
+# note_grammar.py
+#
+# Structured output for chunk notes. A llama.cpp GBNF grammar pins the output
+# to the prompted sections, in order, each heading exactly once, with a capped
+# number of bullets of capped length. Generation ends when the last section is
+# complete (the grammar then only allows end-of-text), so there is no rambling
+# or repeated sections, and the output always parses with split_note_sections.
+
+import functools
+import math
+
+from utils import note_sections
+
+SECTION_BULLETS = {             # Max bullets per section
+    "key_takeaways": 5,
+    "definitions": 5,
+    "importance": 3,
+    "exam_alerts": 3,
+    "questions": 3
+}
+BULLET_CHARS = 100              # Per-bullet length cap enforced by the grammar
+# Worst case for the budget, not the ~4 chars of plain English: the notes keep
+# Arabic terms, numbers and symbols, which split into far smaller tokens
+MIN_CHARS_PER_TOKEN = 1.5
+
+# Cut free-form output at the start of a new prompt turn or transcript echo
+STOP_SEQUENCES = ["[INST]", "</s>", "--- Transcript Chunk Start ---", "\n## Chunk"]
+
+
+def _optional_chain(rule, count):
+    # "bullet (bullet (bullet)?)?": up to `count` items, unambiguous for the parser
+    chain = ""
+    for _ in range(count - 1):
+        chain = f" ({rule}{chain})?"
+    return rule + chain
+
+
+def notes_grammar(include_exam=True):
+    """GBNF grammar text for one chunk's notes."""
+    sections = note_sections(include_exam)
+    rules = ["root ::= " + " ".join(key for key, _ in sections)]
+    for key, heading in sections:
+        rules.append(f'{key} ::= "{heading}\\n" {_optional_chain("bullet", SECTION_BULLETS[key])} "\\n"')
+    # A bullet never starts with a heading mark and never spans lines
+    rules.append(f'bullet ::= "- " [^\\n#] [^\\n]{{0,{BULLET_CHARS - 1}}} "\\n"')
+    return "\n".join(rules) + "\n"
+
+
+def structured_max_tokens(include_exam=True):
+    """Generation budget that fits the longest output the grammar allows."""
+    bullet_tokens = math.ceil((len("- \n") + BULLET_CHARS) / MIN_CHARS_PER_TOKEN)
+    # Headings are fixed text; a byte-level tokenizer never needs more than a token per byte
+    return sum(len(f"{heading}\n\n".encode("utf-8")) + SECTION_BULLETS[key] * bullet_tokens
+               for key, heading in note_sections(include_exam))
+
+
+@functools.lru_cache(maxsize=None)
+def compile_grammar(grammar_text):
+    """Parsed llama_cpp grammar, built once per process for each grammar text."""
+    from llama_cpp import LlamaGrammar  # Imported lazily like the model itself
+    return LlamaGrammar.from_string(grammar_text, verbose=False)
@@ -0,0 +1,262 @@
+# notes_index.py
+#
+# Structured views of generated notes.
+#
+# Every saved lecture gets a sidecar (notes.json next to notes.md) with its
+# sections already split out per chunk: Key Takeaways, Definitions, Inferred
+# Importance, Exam Alerts and Questions, plus scores. Each course keeps an
+# inverted index (notes_index.json) from terms to the lectures and sections
+# they appear in, updated incrementally whenever a lecture is saved. Revision
+# and search read these instead of re-reading and re-parsing every notes.md.
+#
+#   python notes_index.py Lecture_Outputs/<course> "gradient descent" --section exam_alerts
+
+import argparse
+import json
+import math
+import os
+import re
+import threading
+from datetime import datetime
+
+from utils import split_note_sections, score_chunk_for_importance
+
+SIDECAR_NAME = "notes.json"
+INDEX_NAME = "notes_index.json"
+
+# Sections in the order they appear in notes and are fed to revision
+SECTIONS = ["key_takeaways", "definitions", "importance", "exam_alerts", "questions"]
+
+TERM = re.compile(r"\w{2,}")
+STOPWORDS = {
+    "the", "and", "for", "are", "was", "with", "that", "this", "from", "into", "its", "it's",
+    "of", "to", "in", "on", "is", "be", "as", "by", "or", "an", "at", "it", "if", "we", "can"
+}
+
+# Concurrent jobs can save lectures of the same course; course index updates are read-modify-write
+_index_lock = threading.RLock()
+
+
+def index_terms(text):
+    """Lowercased word terms of a text (works for Arabic and English), without stopwords."""
+    return [t for t in TERM.findall(text.lower()) if t not in STOPWORDS and not t.isdigit()]
+
+
+def _write_json(path, data):
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+def build_sidecar(notes):
+    """
+    Structured form of a lecture's notes.
+
+    Args:
+        notes (list): note dicts with index, content and score
+
+    Returns:
+        dict: chunks (index, score, sections) in lecture order and the lecture's total score
+    """
+    chunks = [
+        {"index": n["index"], "score": n["score"], "sections": split_note_sections(n["content"])}
+        for n in sorted(notes, key=lambda n: n["index"])
+    ]
+    return {
+        "chunks": chunks,
+        "score": sum(c["score"] for c in chunks),
+        "updated": datetime.now().isoformat()
+    }
+
+
+def save_notes_sidecar(notes, lecture_dir):
+    """Writes the lecture's sidecar and updates its course index. Returns the sidecar path."""
+    path = os.path.join(lecture_dir, SIDECAR_NAME)
+    sidecar = build_sidecar(notes)
+    _write_json(path, sidecar)
+    course_dir = os.path.dirname(lecture_dir)
+    with _index_lock:
+        if load_course_index(course_dir) is None:
+            rebuild_course_index(course_dir)  # First save in this course: pick up older lectures too
+        else:
+            update_course_index(course_dir, os.path.basename(lecture_dir), sidecar)
+    return path
+
+
+def load_sidecar(lecture_dir):
+    path = os.path.join(lecture_dir, SIDECAR_NAME)
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def sidecar_from_markdown(notes_path):
+    """Parses an existing notes.md (e.g. from before sidecars existed) into a sidecar."""
+    with open(notes_path, "r", encoding="utf-8") as f:
+        text = f.read()
+    parts = re.split(r"^## Chunk (\d+)\s*$", text, flags=re.MULTILINE)
+    notes = [
+        {"index": int(index), "content": content, "score": score_chunk_for_importance(content)}
+        for index, content in zip(parts[1::2], parts[2::2])
+    ]
+    if not notes and text.strip():
+        notes = [{"index": 1, "content": text, "score": score_chunk_for_importance(text)}]
+    return build_sidecar(notes)
+
+
+def load_course_index(course_dir):
+    path = os.path.join(course_dir, INDEX_NAME)
+    if os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    return None
+
+
+def update_course_index(course_dir, lecture, sidecar, index=None, save=True):
+    """
+    Replaces one lecture's postings in the course index. Only that lecture's
+    terms are touched, so saving a lecture costs the same for 5 or 500 lectures.
+
+    Postings map term -> lecture -> section -> occurrence count.
+    """
+    index = index or load_course_index(course_dir) or {"lectures": {}, "postings": {}}
+    postings = index["postings"]
+
+    # Drop the lecture's previous postings
+    for term in index["lectures"].get(lecture, {}).get("terms", []):
+        entry = postings.get(term)
+        if entry:
+            entry.pop(lecture, None)
+            if not entry:
+                del postings[term]
+
+    counts = {}
+    for chunk in sidecar["chunks"]:
+        for section, items in chunk["sections"].items():
+            for term in index_terms(" ".join(items)):
+                by_section = counts.setdefault(term, {})
+                by_section[section] = by_section.get(section, 0) + 1
+
+    for term, by_section in counts.items():
+        postings.setdefault(term, {})[lecture] = by_section
+    index["lectures"][lecture] = {"terms": sorted(counts), "score": sidecar["score"], "chunks": len(sidecar["chunks"])}
+    index["updated"] = datetime.now().isoformat()
+
+    if save:
+        _write_json(os.path.join(course_dir, INDEX_NAME), index)
+    return index
+
+
+def rebuild_course_index(course_dir):
+    """
+    Builds the index from scratch, creating sidecars for lectures that only
+    have notes.md. Needed once for courses generated before indexing existed.
+    """
+    index = {"lectures": {}, "postings": {}}
+    with _index_lock:
+        for name in sorted(os.listdir(course_dir)):
+            lecture_dir = os.path.join(course_dir, name)
+            notes_path = os.path.join(lecture_dir, "notes.md")
+            if not os.path.isfile(notes_path):
+                continue
+            sidecar = load_sidecar(lecture_dir)
+            if sidecar is None:
+                sidecar = sidecar_from_markdown(notes_path)
+                _write_json(os.path.join(lecture_dir, SIDECAR_NAME), sidecar)
+            update_course_index(course_dir, name, sidecar, index, save=False)
+        _write_json(os.path.join(course_dir, INDEX_NAME), index)
+    print(f"[INDEX] Indexed {len(index['lectures'])} lectures in {course_dir}")
+    return index
+
+
+def indexed_lectures(course_dir):
+    """Lecture folder names of a course in order, from the index (built on first use)."""
+    index = load_course_index(course_dir) or rebuild_course_index(course_dir)
+    return sorted(index["lectures"])
+
+
+def lecture_sections(course_dir, lecture, sections=None):
+    """
+    Bullets of one lecture grouped by section, in chunk order and without
+    duplicates. `sections` limits which sections are returned.
+    """
+    sidecar = load_sidecar(os.path.join(course_dir, lecture))
+    if sidecar is None:
+        return {}
+    grouped = {}
+    for chunk in sidecar["chunks"]:
+        for section, items in chunk["sections"].items():
+            if sections is None or section in sections:
+                bucket = grouped.setdefault(section, [])
+                bucket.extend(item for item in items if item not in bucket)
+    return grouped
+
+
+def format_sections(grouped):
+    """Renders grouped sections back to compact Markdown."""
+    titles = {
+        "key_takeaways": "Key Takeaways",
+        "definitions": "Definitions & Terms",
+        "importance": "Inferred Importance",
+        "exam_alerts": "Exam Alerts",
+        "questions": "Potential Exam Questions"
+    }
+    blocks = []
+    for section in SECTIONS:
+        if grouped.get(section):
+            blocks.append(f"### {titles[section]}\n" + "\n".join(f"- {item}" for item in grouped[section]))
+    return "\n\n".join(blocks)
+
+
+def search_notes(course_dir, query, sections=None, limit=10):
+    """
+    Ranks lectures by TF-IDF of the query terms (optionally only within some
+    sections) and returns the matching bullets from each lecture's sidecar.
+
+    Returns:
+        list: dicts with lecture, score and matches (section -> bullets)
+    """
+    index = load_course_index(course_dir) or rebuild_course_index(course_dir)
+    terms = set(index_terms(query))
+    n_lectures = max(1, len(index["lectures"]))
+
+    scores = {}
+    for term in terms:
+        lectures = index["postings"].get(term, {})
+        idf = math.log(1 + n_lectures / len(lectures)) if lectures else 0.0
+        for lecture, by_section in lectures.items():
+            tf = sum(count for section, count in by_section.items() if sections is None or section in sections)
+            if tf:
+                scores[lecture] = scores.get(lecture, 0.0) + tf * idf
+
+    results = []
+    for lecture, score in sorted(scores.items(), key=lambda kv: kv[1], reverse=True)[:limit]:
+        matches = {}
+        for section, items in lecture_sections(course_dir, lecture, sections).items():
+            hits = [item for item in items if terms & set(index_terms(item))]
+            if hits:
+                matches[section] = hits
+        results.append({"lecture": lecture, "score": round(score, 3), "matches": matches})
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Search a course's generated notes.")
+    parser.add_argument("course_dir", help="Lecture_Outputs/<course>")
+    parser.add_argument("query", help="Search terms")
+    parser.add_argument("--section", action="append", choices=SECTIONS, help="Only search these sections")
+    parser.add_argument("--limit", type=int, default=10)
+    parser.add_argument("--rebuild", action="store_true", help="Rebuild the index (and missing sidecars) first")
+    args = parser.parse_args()
+
+    if args.rebuild:
+        rebuild_course_index(args.course_dir)
+    for result in search_notes(args.course_dir, args.query, args.section, args.limit):
+        print(f"\n## {result['lecture']} (score {result['score']})")
+        print(format_sections(result["matches"]))
+
+
+if __name__ == "__main__":
+    main()
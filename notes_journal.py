@@ -0,0 +1,105 @@
+# notes_journal.py
+#
+# Append-only journal of finished chunks per lecture (notes_journal.jsonl), so
+# note generation resumes from the first missing chunk after a stop or crash.
+#
+# The first line is a header holding a hash of the generation settings. Every
+# further line is one finished chunk: its output, score and summary plus a chain
+# hash of the transcript up to and including that chunk. A chunk is reused only
+# when both match, so an edited transcript or changed settings regenerate from
+# the first difference. Lines are fsync'ed as written; a torn last line (power
+# loss mid-write) fails to parse and is ignored.
+
+import hashlib
+import json
+import os
+
+from llm_cache import make_cache_key
+
+JOURNAL_NAME = "notes_journal.jsonl"
+
+
+def settings_key(model_path, settings):
+    """Hash of the model file and generation settings a journal is valid for."""
+    return make_cache_key(model_path, settings, JOURNAL_NAME)
+
+
+def chain_hash(previous_hash, chunk):
+    """Hash of the transcript so far: the previous chunk's chain hash plus this chunk."""
+    return hashlib.sha256(f"{previous_hash or ''}\n{chunk}".encode("utf-8")).hexdigest()
+
+
+class NotesJournal:
+    """
+    Journal for one lecture. Entries of a journal written with other settings
+    are discarded on open.
+    """
+
+    def __init__(self, lecture_dir, key):
+        self.path = os.path.join(lecture_dir, JOURNAL_NAME)
+        self.key = key
+        self.entries = {}
+
+        if not self._load():
+            self._write_header()
+
+    def _load(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                lines = f.read().splitlines()
+        except OSError:
+            return False
+
+        try:
+            header = json.loads(lines[0]) if lines else None
+        except ValueError:
+            header = None
+        if not header or header.get("key") != self.key:
+            return False
+
+        for line in lines[1:]:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                break  # Torn write: everything before it is intact
+            self.entries[entry["index"]] = entry  # Later lines win
+
+        if self.entries:
+            print(f"[JOURNAL] {len(self.entries)} finished chunks found in {self.path}")
+        return True
+
+    def _write_header(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(json.dumps({"key": self.key}) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+
+    def lookup(self, index, transcript_hash):
+        """Returns the journaled entry for chunk `index` if it was made from the same transcript."""
+        entry = self.entries.get(index)
+        if entry and entry["transcript_hash"] == transcript_hash:
+            return entry
+        return None
+
+    def record(self, index, transcript_hash, content, score, summary):
+        """Appends a finished chunk and forces it to disk before returning."""
+        entry = {
+            "index": index,
+            "transcript_hash": transcript_hash,
+            "content": content,
+            "score": score,
+            "summary": summary
+        }
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        self.entries[index] = entry
+
+    def remove(self):
+        """Deletes the journal once the lecture's notes are complete."""
+        if os.path.exists(self.path):
+            os.remove(self.path)
@@ -1,36 +1,97 @@
 # output_manager.py
+#
+# Lecture artifacts are stored in the course's SQLite store (course_store.py).
+# The text files next to it (transcript_*.txt, notes.md, processing_log.txt)
+# are exports: written atomically on save while EXPORT_FILES is on, and
+# re-creatable at any time with export_lecture.
 
 import os
 from datetime import datetime
+from course_store import get_store, COURSE_SCOPE
+from utils import extract_key_summary
+from tracing import span
+
+EXPORT_FILES = True  # Keep human-readable files next to the database
 
 def sanitize_filename(name):
     return "_".join(name.strip().lower().split())
 
+def course_output_dir(base_dir, course_name):
+    """The course folder; every caller must use this so names match."""
+    return os.path.join(base_dir, sanitize_filename(course_name))
+
 def create_output_paths(base_dir, course_name, lecture_title):
-    course_dir = os.path.join(base_dir, sanitize_filename(course_name))
-    lecture_dir = os.path.join(course_dir, sanitize_filename(lecture_title))
+    lecture_dir = os.path.join(course_output_dir(base_dir, course_name), sanitize_filename(lecture_title))
 
     os.makedirs(lecture_dir, exist_ok=True)
     return lecture_dir
 
+def _store_for(lecture_dir):
+    # Lecture folders sit directly inside their course folder
+    lecture_dir = os.path.abspath(lecture_dir)
+    return get_store(os.path.dirname(lecture_dir)), os.path.basename(lecture_dir)
+
+def _write_text(path, text):
+    # Temp file + rename, so a crash never leaves a truncated export
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+    return path
+
+def format_notes(notes):
+    return "\n\n".join([f"## Chunk {n['index']}\n\n{n['content']}" for n in notes])
+
 def save_transcript(transcript_text, lecture_dir, lang="en"):
-    filename = f"transcript_{lang}.txt"
-    path = os.path.join(lecture_dir, filename)
-    with open(path, "w", encoding="utf-8") as f:
-        f.write(transcript_text)
+    path = os.path.join(lecture_dir, f"transcript_{lang}.txt")
+    with span("write.transcript", chars=len(transcript_text)):
+        store, lecture = _store_for(lecture_dir)
+        store.save_transcript(lecture, transcript_text, lang)
+        if EXPORT_FILES:
+            _write_text(path, transcript_text)
     return path
 
 def save_notes_markdown(notes_text, lecture_dir):
     path = os.path.join(lecture_dir, "notes.md")
-    with open(path, "w", encoding="utf-8") as f:
-        f.write(notes_text)
+    with span("write.notes", chars=len(notes_text)):
+        _write_text(path, notes_text)
     return path
 
+def save_chunk_notes(notes, lecture_dir):
+    """Stores a lecture's finished chunk notes (display order) and exports notes.md."""
+    store, lecture = _store_for(lecture_dir)
+    with span("write.store", chunks=len(notes)):
+        store.save_chunk_notes(lecture, [dict(n, summary=n.get("summary") or extract_key_summary(n["content"]))
+                                         for n in notes])
+    return save_notes_markdown(format_notes(notes), lecture_dir)
+
+def save_course_summary(course_dir, kind, text, filename):
+    """Stores a course-wide summary (e.g. the revision) and exports it as `filename`."""
+    get_store(course_dir).save_summary(COURSE_SCOPE, kind, text)
+    return _write_text(os.path.join(course_dir, filename), text)
+
 def save_log(message, lecture_dir):
-    log_path = os.path.join(lecture_dir, "processing_log.txt")
-    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    with open(log_path, "a", encoding="utf-8") as f:
-        f.write(f"[{timestamp}] {message}\n")
+    store, lecture = _store_for(lecture_dir)
+    store.log(lecture, message)
+    if EXPORT_FILES:
+        log_path = os.path.join(lecture_dir, "processing_log.txt")
+        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        with open(log_path, "a", encoding="utf-8") as f:
+            f.write(f"[{timestamp}] {message}\n")
+
+def export_lecture(course_dir, lecture):
+    """Re-creates a lecture's transcript and notes files from the store."""
+    store = get_store(course_dir)
+    lecture_dir = os.path.join(course_dir, lecture)
+    os.makedirs(lecture_dir, exist_ok=True)
+    paths = [
+        _write_text(os.path.join(lecture_dir, f"transcript_{lang}.txt"), text)
+        for lang, text in store.get_transcripts(lecture).items()
+    ]
+    notes = store.get_chunk_notes(lecture)
+    if notes:
+        paths.append(save_notes_markdown(format_notes(notes), lecture_dir))
+    return paths
 
 def list_all_notes(course_dir):
     """Return paths to all notes.md under a given course folder."""
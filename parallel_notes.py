@@ -0,0 +1,193 @@
+# parallel_notes.py
+#
+# Opt-in parallel note generation. The sequential path feeds each chunk the key
+# summary of the previous chunk's *notes*, which forces one chunk at a time. Here
+# the context is the tail of the previous *transcript* chunk instead, known before
+# any generation, so chunks are independent and run on a pool of model worker
+# processes, each with its own llama.cpp context. Results are put back in lecture
+# order, so notes.md has the same structure as in sequential mode.
+
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, wait
+
+import psutil
+from tqdm import tqdm
+
+import mistral_notes
+import model_registry
+from output_manager import save_notes_markdown, format_notes
+from notes_journal import chain_hash
+from utils import (
+    tail_to_token_budget,
+    score_chunk_for_importance,
+    extract_key_summary,
+    build_prompt_prefix,
+    prepare_contextual_prompt
+)
+from whisper_offline import should_abort
+from tracing import span, record_span, debug_log
+from worker_pool import WorkerPool
+
+MIN_THREADS_PER_WORKER = 4     # Fewer threads than this per context wastes more than it gains
+WORKER_OVERHEAD_MB = 1024      # KV cache + compute buffers per context (weights are shared via mmap)
+
+notes_pools = set()  # Live pools (one per running job), for emergency stop
+
+
+def plan_note_workers(requested=-1, model_path=None):
+    """
+    Number of model worker processes and llama.cpp threads per worker.
+
+    Capped by cores (MIN_THREADS_PER_WORKER each) and by available RAM. Weights
+    are memory-mapped, so the page cache holds one copy for all workers; each
+    worker adds its own context buffers on top.
+
+    Args:
+        requested (int): Wanted worker count, -1 to size to the machine
+
+    Returns:
+        tuple: (workers, threads per worker)
+    """
+    cores = os.cpu_count() or 2
+    by_cores = max(1, cores // MIN_THREADS_PER_WORKER)
+
+    model_path = model_path or mistral_notes.MODEL_PATH
+    model_mb = os.path.getsize(model_path) / (1024 * 1024) if os.path.exists(model_path) else 0
+    available_mb = psutil.virtual_memory().available / (1024 * 1024) - model_mb
+    by_ram = max(1, int(available_mb // WORKER_OVERHEAD_MB))
+
+    workers = min(by_cores, by_ram) if requested < 0 else max(1, min(requested, cores, by_ram))
+    return workers, max(1, cores // workers)
+
+
+def _init_worker(model_path, n_threads, model_factory):
+    """Configures a worker process and loads its model once."""
+    mistral_notes.MODEL_PATH = model_path
+    mistral_notes.LLM_THREADS = n_threads
+    if "n_threads_batch" in mistral_notes.LLM_PARAMS:
+        # The profile's batch threads are for one context on the whole machine
+        mistral_notes.LLM_PARAMS = dict(mistral_notes.LLM_PARAMS, n_threads_batch=n_threads)
+    model_registry.set_model_factory(model_factory)
+    model_registry.acquire_model(model_path, mistral_notes.CTX_SIZE, n_threads=n_threads, **mistral_notes.LLM_PARAMS)
+
+
+def _generate_chunk(prompt, prefix, max_tokens, grammar):
+    """
+    Worker-process entry point: notes for one chunk (or the cached result).
+
+    Returns:
+        tuple: (notes text, seconds spent)
+    """
+    started = time.perf_counter()
+    result = mistral_notes.run_model(prompt, prefix, max_tokens, grammar=grammar)
+    return result, time.perf_counter() - started
+
+
+def generate_chunk_notes_parallel(chunks, notes, include_exam, count_tokens, lecture_dir,
+                                  workers=-1, gui_callback=None, journal=None, progress_callback=None):
+    """
+    Generates notes for each chunk on a process pool, appending to `notes` in
+    lecture order. `chunks` may still be growing (streamed from transcription);
+    each chunk is dispatched as soon as it arrives. notes.md is rewritten
+    whenever the next chunk in order is ready. Journaled chunks are not dispatched.
+    """
+    workers, n_threads = plan_note_workers(workers)
+    print(f"[MISTRAL] Parallel mode: {workers} workers x {n_threads} threads")
+
+    prefix = build_prompt_prefix(include_exam=include_exam, translate_to_english=True)
+    max_tokens, grammar = mistral_notes.note_output(include_exam)  # Decided here: workers import fresh settings
+    chunks = iter(chunks)
+    previous_chunk = None
+    transcript_hash = None
+    dispatched = 0
+    next_index = 1
+    ready = {}
+    exhausted = False
+    in_flight = {}
+    pbar = tqdm(desc="[MISTRAL] Generating Notes", unit="chunk")
+
+    notes_pool = WorkerPool(workers, _init_worker,
+                            (os.path.abspath(mistral_notes.MODEL_PATH), n_threads, model_registry._model_factory))
+    notes_pools.add(notes_pool)
+    try:
+        while not exhausted or in_flight:
+            # Keep every worker busy plus one queued chunk each
+            while not exhausted and len(in_flight) < workers * 2:
+                chunk = next(chunks, None)
+                if chunk is None:
+                    exhausted = True
+                    break
+                dispatched += 1
+                transcript_hash = chain_hash(transcript_hash, chunk)
+                entry = journal.lookup(dispatched, transcript_hash) if journal else None
+                if entry:
+                    ready[dispatched] = (entry["content"], entry["score"])
+                    previous_chunk = chunk
+                    pbar.update(1)
+                    continue
+                context = None
+                if previous_chunk:
+                    context = tail_to_token_budget(previous_chunk, mistral_notes.SUMMARY_TOKENS, count_tokens)
+                prompt = prepare_contextual_prompt(
+                    chunk,
+                    previous_chunk=context,
+                    include_exam=include_exam,
+                    translate_to_english=True
+                )
+                previous_chunk = chunk
+                in_flight[notes_pool.submit(_generate_chunk, prompt, prefix, max_tokens, grammar)] = (dispatched, transcript_hash)
+                debug_log(f"[MISTRAL] Dispatched chunk {dispatched}...")
+
+            finished = []
+            if in_flight:
+                finished, _ = wait(in_flight, timeout=0.5, return_when=FIRST_COMPLETED)
+            if should_abort():
+                print(f"[MISTRAL] Aborting at chunk {next_index} due to shutdown.")
+                with open("shutdown_log.txt", "a", encoding="utf-8") as log:
+                    log.write(f"[MISTRAL] Aborted during chunk {next_index}.\n")
+                break
+
+            for future in finished:
+                index, chunk_hash = in_flight.pop(future)
+                result, elapsed = future.result()
+                # Generation happened in a worker process, so only wall time is known here
+                record_span("llm.chunk", elapsed, chunk=index, parallel_workers=workers)
+                debug_log(f"\n🔹 [CHUNK {index} OUTPUT]:\n{result}\n")
+                with span("scoring", chunk=index) as attrs:
+                    score = score_chunk_for_importance(result)
+                    attrs["score"] = score
+                if journal:
+                    journal.record(index, chunk_hash, result, score, extract_key_summary(result))
+                ready[index] = (result, score)
+                pbar.update(1)
+
+            # Emit in lecture order
+            flushed = False
+            while next_index in ready:
+                result, score = ready.pop(next_index)
+                notes.append({"index": next_index, "content": result, "score": score})
+                next_index += 1
+                flushed = True
+            if flushed:
+                save_notes_markdown(format_notes(notes), lecture_dir)
+                if gui_callback:
+                    gui_callback(f"🧠 Notes ready for chunk {next_index - 1}", "purple")
+                if progress_callback:
+                    # Tokens are generated in the workers; only finished chunks are known here
+                    progress_callback({"stage": "llm", "chunk": next_index - 1, "chunks_done": len(notes)})
+    finally:
+        pbar.close()
+        notes_pools.discard(notes_pool)
+        if in_flight:  # Stopped early: workers would otherwise finish their chunks
+            notes_pool.terminate()
+        notes_pool.shutdown(wait=False, cancel_futures=True)
+
+
+def kill_note_workers():
+    """
+    Terminates model worker processes. Called on abort and emergency shutdown,
+    since a worker does not see the abort flag mid-generation.
+    """
+    for pool in list(notes_pools):
+        pool.terminate()
@@ -0,0 +1,166 @@
+# pipeline.py
+#
+# Streaming lecture pipeline: transcript windows flow from Whisper through a
+# bounded queue into the token chunker and on to note generation, so the two
+# CPU-heavy stages run at the same time instead of one after the other.
+
+import os
+import queue
+import threading
+from whisper_offline import (
+    iter_window_transcripts,
+    should_abort,
+    WHISPER_ENGINE,
+    COMPUTE_TYPE,
+    BEAM_SIZE,
+    WINDOW_SEC,
+    CPU_THREADS
+)
+from mistral_notes import (
+    generate_notes_from_chunks,
+    load_token_counter,
+    chunk_token_budget,
+    CHUNK_OVERLAP_TOKENS,
+    LLM_THREADS
+)
+import mistral_notes
+from transcript_cleanup import TranscriptCleaner, report_cleanup
+from utils import iter_token_chunks
+from output_manager import create_output_paths
+from tracing import trace_to, bind_tracer
+
+QUEUE_SIZE = 4  # Transcript windows allowed to wait for the LLM before Whisper blocks
+
+_DONE = object()  # Sentinel put on the queue when transcription finishes
+
+
+def stage_thread_budget(llm_threads=LLM_THREADS, whisper_threads=None):
+    """
+    Splits the machine's cores between the stages: the LLM keeps `llm_threads`
+    and Whisper workers share what is left.
+
+    Returns:
+        tuple: (whisper_workers, whisper_threads_per_worker)
+    """
+    cores = os.cpu_count() or 2
+    available = max(1, cores - llm_threads)
+    whisper_threads = whisper_threads or min(CPU_THREADS, available)  # Per-worker threads from the profile, if any
+    return max(1, available // whisper_threads), whisper_threads
+
+
+def run_streaming_pipeline(
+    audio_path,
+    lang_mode,
+    course,
+    lecture,
+    rerank=True,
+    include_exam=True,
+    gui_callback=None,
+    debug=False,
+    queue_size=QUEUE_SIZE,
+    whisper_workers=None,
+    whisper_threads=None,
+    progress_callback=None
+):
+    """
+    Transcribes and generates notes concurrently.
+
+    Whisper runs in a producer thread and puts each finished window's text on a
+    bounded queue (it blocks when the queue is full, so a slow LLM applies
+    backpressure). The calling thread chunks that stream by token budget and
+    generates notes as soon as each chunk is full.
+
+    `progress_callback` (optional) receives progress dicts from both stages:
+    {"stage": "whisper", "audio_sec", "total_sec"}, a final one with
+    "done": True once every window is transcribed, and the LLM ones described
+    in generate_notes_from_chunks. It is called from worker threads.
+
+    Returns:
+        tuple: (transcript_text, notes)
+    """
+    default_workers, default_threads = stage_thread_budget(whisper_threads=whisper_threads)
+    whisper_workers = whisper_workers or default_workers
+    whisper_threads = whisper_threads or default_threads
+
+    text_queue = queue.Queue(maxsize=queue_size)
+    stop_event = threading.Event()
+    transcript_parts = []
+    producer_error = []
+
+    def put(item):
+        # Blocking put that still notices when the consumer has given up
+        while not stop_event.is_set():
+            try:
+                text_queue.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce():
+        bind_tracer(tracer)  # Whisper spans go to the same lecture trace
+        try:
+            duration = 0.0
+            for window in iter_window_transcripts(audio_path, lang_mode, WHISPER_ENGINE, COMPUTE_TYPE,
+                                                  whisper_threads, BEAM_SIZE, whisper_workers, WINDOW_SEC):
+                if window is None or stop_event.is_set():
+                    break
+                duration = window["duration"]
+                transcript_parts.append(window["text"])
+                if gui_callback:
+                    gui_callback(f"🎧 Transcribed up to {window['end'] / 60:.1f} min", "green")
+                if progress_callback:
+                    progress_callback({"stage": "whisper", "audio_sec": window["end"], "total_sec": window["duration"]})
+                if not put(window["text"] + "\n"):
+                    break
+            else:
+                # With VAD the last window ends at the last speech, so progress can't tell it's finished
+                if progress_callback:
+                    progress_callback({"stage": "whisper", "audio_sec": duration, "total_sec": duration, "done": True})
+        except Exception as e:
+            producer_error.append(e)
+        finally:
+            put(_DONE)
+
+    def consume(cleaner):
+        while True:
+            item = text_queue.get()
+            if item is _DONE:
+                return
+            if cleaner:
+                # Per window (linear overall); the cleaner carries the previous window's tail
+                item, _ = cleaner.clean(item)
+            yield item
+
+    with trace_to(create_output_paths("Lecture_Outputs", course, lecture)) as tracer:
+        producer = threading.Thread(target=produce, name="whisper-producer", daemon=True)
+        producer.start()
+
+        completed = False
+        try:
+            count_tokens = load_token_counter()
+            budget = chunk_token_budget(count_tokens, include_exam)
+            cleaner = TranscriptCleaner(count_tokens) if mistral_notes.TRANSCRIPT_CLEANUP else None
+            chunks = iter_token_chunks(consume(cleaner), budget, count_tokens, CHUNK_OVERLAP_TOKENS)
+            notes = generate_notes_from_chunks(
+                chunks, course, lecture,
+                rerank=rerank,
+                include_exam=include_exam,
+                gui_callback=gui_callback,
+                debug=debug,
+                count_tokens=count_tokens,
+                progress_callback=progress_callback,
+                source_complete=lambda: not producer_error  # Keep the journal if Whisper failed
+            )
+            completed = not should_abort()
+            if cleaner:
+                print(report_cleanup(cleaner.stats))
+        finally:
+            # Unblock the producer if note generation stopped early or failed
+            stop_event.set()
+            producer.join(timeout=None if completed else 5)
+
+    if producer_error:
+        raise RuntimeError("Transcription failed") from producer_error[0]
+
+    return "\n".join(transcript_parts) + "\n", notes
@@ -0,0 +1,70 @@
+# prefix_cache.py
+#
+# Saves the llama.cpp state right after a shared prompt prefix has been evaluated,
+# so later prompts starting with the same prefix only evaluate their own suffix.
+
+import threading
+import weakref
+
+# llm -> {prefix text: LlamaState}; entries disappear when the model is unloaded
+_prefix_states = weakref.WeakKeyDictionary()
+_lock = threading.Lock()
+
+
+def _tokenize(llm, text):
+    return llm.tokenize(text.encode("utf-8"), add_bos=True, special=True)
+
+
+def get_prefix_state(llm, prefix):
+    """
+    Returns the saved state for `prefix` on this model, evaluating it on first use.
+    Caller must hold the model's inference lock.
+    """
+    with _lock:
+        states = _prefix_states.setdefault(llm, {})
+        state = states.get(prefix)
+    if state is not None:
+        return state
+
+    llm.reset()
+    llm.eval(_tokenize(llm, prefix))
+    state = llm.save_state()
+    with _lock:
+        states[prefix] = state
+    return state
+
+
+def complete_with_prefix(llm, prefix, prompt, **kwargs):
+    """
+    Runs `llm(prompt, **kwargs)` with the KV state of `prefix` restored first.
+
+    llama_cpp only evaluates the tokens after the longest common prefix between
+    the loaded state and the prompt, so the shared header costs nothing per call.
+    Caller must hold the model's inference lock.
+    """
+    if not prompt.startswith(prefix):
+        raise ValueError("Prompt does not start with the cached prefix")
+
+    llm.load_state(get_prefix_state(llm, prefix))
+    return llm(prompt, **kwargs)
+
+
+def stream_with_prefix(llm, prefix, prompt, **kwargs):
+    """
+    Streaming variant of complete_with_prefix: yields generated text piece by
+    piece. Caller must hold the model's inference lock until iteration ends.
+    """
+    for chunk in complete_with_prefix(llm, prefix, prompt, stream=True, **kwargs):
+        choice = chunk["choices"][0]
+        piece = choice.get("text") or choice.get("delta", {}).get("content", "")
+        if piece:
+            yield piece
+
+
+def clear_prefix_cache(llm=None):
+    """Drops saved prefix states for one model, or for all models."""
+    with _lock:
+        if llm is None:
+            _prefix_states.clear()
+        else:
+            _prefix_states.pop(llm, None)
@@ -0,0 +1,94 @@
+# progress.py
+#
+# Throughput and ETA for a running lecture job, fed with the progress dicts
+# that run_streaming_pipeline reports ({"stage": "whisper" | "llm", ...}).
+# Rates are measured, not guessed: audio seconds transcribed per wall second,
+# and generated tokens per second over a sliding window.
+
+import time
+from collections import deque
+
+RATE_WINDOW_SEC = 10.0  # Token rate is averaged over this much recent time
+
+
+class JobProgress:
+    """Progress state of one job. Not thread-safe: update it from one thread (the GUI loop)."""
+
+    def __init__(self, name):
+        self.name = name
+        self.started = time.monotonic()
+        self.audio_sec = 0.0
+        self.total_sec = None
+        self.whisper_done = None       # Time Whisper reported it was done
+        self.chunks_done = 0
+        self.tokens = 0
+        self.token_samples = deque()   # (time, total tokens)
+        self.first_chunk_at = None     # LLM time starts with the first generated token
+
+    def update(self, event):
+        now = time.monotonic()
+        if event["stage"] == "whisper":
+            self.audio_sec = event["audio_sec"]
+            self.total_sec = event.get("total_sec") or self.total_sec
+            if event.get("done"):
+                self.whisper_done = now
+        elif event["stage"] == "llm":
+            if self.first_chunk_at is None:
+                self.first_chunk_at = now
+            self.chunks_done = max(self.chunks_done, event.get("chunks_done", 0))
+            if "tokens" in event:
+                self.tokens = event["tokens"]
+                self.token_samples.append((now, self.tokens))
+                while len(self.token_samples) > 2 and now - self.token_samples[0][0] > RATE_WINDOW_SEC:
+                    self.token_samples.popleft()
+
+    @property
+    def audio_rate(self):
+        """Audio seconds transcribed per wall-clock second."""
+        elapsed = (self.whisper_done or time.monotonic()) - self.started
+        return self.audio_sec / elapsed if elapsed > 0 else 0.0
+
+    @property
+    def token_rate(self):
+        """Generated tokens per second over the last RATE_WINDOW_SEC."""
+        if len(self.token_samples) < 2:
+            return 0.0
+        (t0, n0), (t1, n1) = self.token_samples[0], self.token_samples[-1]
+        return (n1 - n0) / (t1 - t0) if t1 > t0 else 0.0
+
+    def eta(self):
+        """
+        Seconds until the job is likely done, or None until there is enough
+        to measure. Notes can't finish before the audio is transcribed, so the
+        ETA is the later of the two stages' estimates.
+        """
+        now = time.monotonic()
+        whisper_left = 0.0
+        if self.total_sec and self.whisper_done is None:
+            rate = self.audio_rate
+            if rate <= 0:
+                return None
+            whisper_left = (self.total_sec - self.audio_sec) / rate
+
+        llm_left = 0.0
+        if self.chunks_done and self.audio_sec and self.total_sec:
+            # Chunks come at a steady rate per audio second, so scale by the audio seen so far
+            expected_chunks = self.chunks_done * self.total_sec / self.audio_sec
+            per_chunk = (now - self.first_chunk_at) / self.chunks_done
+            llm_left = max(0.0, expected_chunks - self.chunks_done) * per_chunk
+        elif self.whisper_done is not None:
+            return None  # Waiting for the first chunk's notes
+
+        return max(whisper_left, llm_left)
+
+    def summary_line(self):
+        parts = []
+        if self.total_sec:
+            parts.append(f"🎧 {self.audio_sec / 60:.1f}/{self.total_sec / 60:.1f} min ({self.audio_rate:.1f}x)")
+        if self.chunks_done or self.tokens:
+            parts.append(f"🧠 {self.chunks_done} chunks, {self.token_rate:.1f} tok/s")
+        eta = self.eta()
+        if eta is not None:
+            minutes, seconds = divmod(int(eta), 60)
+            parts.append(f"ETA {minutes}:{seconds:02d}")
+        return " · ".join(parts) or "Starting..."
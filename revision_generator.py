@@ -1,25 +1,53 @@
 # revision_generator.py
 
 import os
-from llama_cpp import Llama
-from output_manager import list_all_notes
+import re
+import json
+import hashlib
+from datetime import datetime
+import mistral_notes
+from output_manager import save_course_summary
+from embedding_index import update_embedding_index, select_sections
+from notes_index import SECTIONS, SIDECAR_NAME, indexed_lectures, lecture_sections, format_sections
+from utils import split_into_token_chunks, clip_to_token_budget
+from whisper_offline import should_abort
+from tracing import span, trace_to
 
-MODEL_PATH = "mistral-7b-instruct-v0.1.Q4_K_M.gguf"
-CTX_SIZE = 4096
+# The model, its settings and the cached runner are mistral_notes' (one shared instance, one cache key scheme)
 MAX_TOKENS = 1536
 
-llm = Llama(model_path=MODEL_PATH, n_ctx=CTX_SIZE)
+# Map-reduce revision
+REVISION_MODE = "mapreduce"     # "mapreduce" (incremental per-lecture summaries), "retrieval"
+                                # (top sections by embedding centrality) or "full" (one prompt)
+SUMMARY_MAX_TOKENS = 400        # Length of each per-lecture / merged summary
+SAFETY_TOKENS = 16
+MANIFEST_NAME = "revision_manifest.json"
+
+# Note sections fed to revision, read from each lecture's sidecar (see notes_index)
+REVISION_SECTIONS = SECTIONS
+
+def lecture_revision_text(course_dir, lecture):
+    """A lecture's revision-relevant sections, de-duplicated, as compact Markdown."""
+    text = format_sections(lecture_sections(course_dir, lecture, REVISION_SECTIONS))
+    if text:
+        return text
+    # Legacy or free-form notes without the expected headings: use the notes as written
+    notes_path = os.path.join(course_dir, lecture, "notes.md")
+    if not os.path.exists(notes_path):
+        return ""
+    with open(notes_path, "r", encoding="utf-8") as f:
+        return re.sub(r"^## Chunk \d+[ \t]*\n*", "", f.read(), flags=re.MULTILINE).strip()
 
 def load_all_notes(course_dir):
-    note_paths = list_all_notes(course_dir)
     all_notes = []
-    for path in note_paths:
-        with open(path, "r", encoding="utf-8") as f:
-            all_notes.append(f.read())
+    for lecture in indexed_lectures(course_dir):
+        text = lecture_revision_text(course_dir, lecture)
+        if text:
+            all_notes.append(f"## {lecture}\n\n{text}")
     return "\n\n".join(all_notes)
 
-def build_revision_prompt(notes_text):
-    return f"""
+# Static head of the revision prompt; its KV state is cached per model
+REVISION_PROMPT_PREFIX = """
 [INST] <<SYS>>
 You are an academic assistant helping a student prepare for their midterm or final exam.
 Your job is to summarize the most important concepts, topics, and alerts from all prior lecture notes.
@@ -37,26 +65,181 @@ Return your output in Markdown format, structured as follows:
 
 Here are all the lecture notes:
 
-{notes_text}
+"""
+
+# Map step: condense one lecture's notes
+LECTURE_SUMMARY_PREFIX = """
+[INST] <<SYS>>
+You are an academic assistant. Condense the lecture notes below into a compact study summary.
+Keep every core concept, definition, exam alert and instructor emphasis; drop repetition.
+Answer with short Markdown bullet points only.
+<</SYS>>
+
+Lecture notes:
+
+"""
+
+# Reduce step: merge several summaries into one
+MERGE_SUMMARY_PREFIX = """
+[INST] <<SYS>>
+You are an academic assistant. Merge the lecture summaries below into one compact study summary.
+Keep concepts that recur across lectures, all exam alerts and instructor emphasis; drop duplicates.
+Answer with short Markdown bullet points only.
+<</SYS>>
+
+Lecture summaries:
+
+"""
+
+def build_revision_prompt(notes_text):
+    return f"""{REVISION_PROMPT_PREFIX}{notes_text}
 [/INST]
 """
 
-def generate_revision_summary(course_dir):
-    notes_text = load_all_notes(course_dir)
+def _build_prompt(prefix, text):
+    return f"""{prefix}{text}
+[/INST]
+"""
+
+def _input_budget(prefix, max_tokens, count_tokens):
+    """Tokens of input text that fit next to a prompt prefix and its generation."""
+    return mistral_notes.CTX_SIZE - max_tokens - count_tokens(_build_prompt(prefix, "")) - SAFETY_TOKENS
+
+def _summarize(text, prefix, count_tokens):
+    """
+    Summarizes text with the given prompt prefix. Text too long for one prompt
+    is split by token budget and the pieces are summarized separately.
+    """
+    budget = _input_budget(prefix, SUMMARY_MAX_TOKENS, count_tokens)
+    pieces = split_into_token_chunks(text, budget, count_tokens)
+    return "\n".join(mistral_notes.run_model(_build_prompt(prefix, piece), prefix, SUMMARY_MAX_TOKENS) for piece in pieces)
+
+def load_manifest(course_dir):
+    path = os.path.join(course_dir, MANIFEST_NAME)
+    if os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    return {"lectures": {}}
+
+def save_manifest(course_dir, manifest):
+    path = os.path.join(course_dir, MANIFEST_NAME)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+def update_lecture_summaries(course_dir, count_tokens):
+    """
+    Map step: returns one summary per lecture (in lecture order), only calling
+    the model for lectures whose notes are new or changed since the last run.
+
+    Lectures come from the course index and are read from their sidecars.
+    Unchanged sidecars are detected by size + mtime first and by content hash
+    when those differ, so touching a file without editing it is free too.
+    A stopped run keeps the previous entries of the lectures it did not reach.
+    """
+    manifest = load_manifest(course_dir)
+    previous = manifest.get("lectures", {})
+    lectures = {}
+    summaries = []
+    changed = 0
+    aborted = False
+
+    for lecture in indexed_lectures(course_dir):
+        key = lecture
+        try:
+            st = os.stat(os.path.join(course_dir, lecture, SIDECAR_NAME))
+        except OSError:
+            continue
+        entry = previous.get(key)
+
+        if not (entry and entry["size"] == st.st_size and entry["mtime_ns"] == st.st_mtime_ns):
+            notes_text = lecture_revision_text(course_dir, lecture)
+            digest = hashlib.sha256(notes_text.encode("utf-8")).hexdigest()
+            if not (entry and entry["hash"] == digest):
+                print(f"[REVISION] Summarizing {key}")
+                summary = _summarize(notes_text, LECTURE_SUMMARY_PREFIX, count_tokens)
+                if should_abort():  # Never store a summary cut short by a stop
+                    aborted = True
+                    break
+                entry = {"hash": digest, "summary": summary}
+                changed += 1
+            entry = dict(entry, size=st.st_size, mtime_ns=st.st_mtime_ns)
+
+        lectures[key] = entry
+        summaries.append(entry["summary"])
+
+    reused = len(lectures) - changed
+    if aborted:
+        lectures = dict(previous, **lectures)
+    manifest = {"lectures": lectures, "updated": datetime.now().isoformat(), "aborted": aborted}
+    save_manifest(course_dir, manifest)
+    print(f"[REVISION] {changed} new/changed lectures, {reused} reused" + (" (stopped early)" if aborted else ""))
+    return summaries
+
+def reduce_summaries(summaries, count_tokens):
+    """
+    Reduce step: merges summaries in groups that fit one prompt, level by level,
+    until the result fits in the final revision prompt.
+    """
+    final_budget = _input_budget(REVISION_PROMPT_PREFIX, MAX_TOKENS, count_tokens)
+    merge_budget = _input_budget(MERGE_SUMMARY_PREFIX, SUMMARY_MAX_TOKENS, count_tokens)
+    level = 0
+
+    while count_tokens("\n\n".join(summaries)) > final_budget:
+        level += 1
+        groups, group, group_tokens = [], [], 0
+        for summary in summaries:
+            n = count_tokens(summary) + 2
+            if group and group_tokens + n > merge_budget:
+                groups.append(group)
+                group, group_tokens = [], 0
+            group.append(summary)
+            group_tokens += n
+        if group:
+            groups.append(group)
+
+        print(f"[REVISION] Reduce level {level}: {len(summaries)} summaries -> {len(groups)}")
+        merged = [_summarize("\n\n".join(g), MERGE_SUMMARY_PREFIX, count_tokens) for g in groups]
+        if len(merged) >= len(summaries):
+            # No further merging possible; trim so the final prompt still fits
+            return clip_to_token_budget("\n\n".join(merged), final_budget, count_tokens)
+        summaries = merged
+
+    return "\n\n".join(summaries)
+
+def generate_revision_summary(course_dir, mode=REVISION_MODE):
+    if mode == "full":
+        count_tokens = mistral_notes.load_token_counter()
+        budget = _input_budget(REVISION_PROMPT_PREFIX, MAX_TOKENS, count_tokens)
+        notes_text = clip_to_token_budget(load_all_notes(course_dir), budget, count_tokens)
+    elif mode == "retrieval":
+        # One prompt of the most central / exam-flagged sections, whatever the course size
+        count_tokens = mistral_notes.load_token_counter()
+        budget = _input_budget(REVISION_PROMPT_PREFIX, MAX_TOKENS, count_tokens)
+        vectors, meta = update_embedding_index(course_dir)
+        with span("revision.select", sections=len(meta["units"]), token_budget=budget):
+            notes_text = select_sections(vectors, meta, budget, count_tokens)
+    else:
+        count_tokens = mistral_notes.load_token_counter()
+        summaries = update_lecture_summaries(course_dir, count_tokens)
+        notes_text = "" if should_abort() else reduce_summaries(summaries, count_tokens)
+
+    if should_abort():
+        return ""
     prompt = build_revision_prompt(notes_text)
-    output = llm(prompt, max_tokens=MAX_TOKENS)
-    result = output["choices"][0].get("text") or output["choices"][0].get("content", "")
-    return result.strip()
+    return mistral_notes.run_model(prompt, REVISION_PROMPT_PREFIX)
 
 def save_revision_summary(course_dir, revision_text):
-    path = os.path.join(course_dir, "revision_summary.md")
-    with open(path, "w", encoding="utf-8") as f:
-        f.write(revision_text)
-    return path
+    return save_course_summary(course_dir, "revision", revision_text, "revision_summary.md")
 
-def run_revision_pipeline(course_dir):
+def run_revision_pipeline(course_dir, mode=REVISION_MODE):
     print(f"[INFO] Generating revision summary for course: {course_dir}")
-    summary = generate_revision_summary(course_dir)
+    with trace_to(course_dir):
+        summary = generate_revision_summary(course_dir, mode)
+    if not summary:
+        print("[REVISION] Stopped before any revision text was generated.")
+        return None
     path = save_revision_summary(course_dir, summary)
     print(f"[SUCCESS] Revision summary saved to: {path}")
     return path
@@ -0,0 +1,20 @@
+# Run with: python -m pytest -q
+
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from audio_utils import SAMPLE_RATE, plan_windows_from_energies
+
+
+def test_windows_shorter_than_search_span_advance():
+    # window_sec <= search_sec used to pick a cut at or before the start and loop forever
+    frame_len = 480
+    total = 60 * SAMPLE_RATE
+    energies = np.ones(total // frame_len, dtype=np.float32)
+    windows = plan_windows_from_energies(energies, frame_len, total, window_sec=5, search_sec=10)
+    assert windows[-1]["end"] == total
+    assert all(later["start"] > earlier["start"] for earlier, later in zip(windows, windows[1:]))
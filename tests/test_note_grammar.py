@@ -0,0 +1,26 @@
+# Run with: python -m pytest -q
+
+import math
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import mistral_notes
+from note_grammar import BULLET_CHARS, SECTION_BULLETS, structured_max_tokens
+from utils import note_sections
+
+
+def test_max_tokens_fits_longest_output_at_one_token_per_one_and_a_half_chars():
+    # Every bullet at the grammar's cap at 1.5 characters per token; headings at one token per byte
+    for include_exam in (True, False):
+        worst = 0
+        for key, heading in note_sections(include_exam):
+            bullet = "- " + "x" * BULLET_CHARS + "\n"
+            worst += len((heading + "\n\n").encode("utf-8")) + SECTION_BULLETS[key] * math.ceil(len(bullet) / 1.5)
+        assert structured_max_tokens(include_exam) >= worst
+
+
+def test_structured_budget_leaves_room_for_transcript():
+    assert structured_max_tokens() <= mistral_notes.MAX_TOKENS
+    assert mistral_notes.chunk_token_budget(len) > 0
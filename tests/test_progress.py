@@ -0,0 +1,19 @@
+# Run with: python -m pytest -q
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from progress import JobProgress
+
+
+def test_whisper_done_when_last_speech_ends_early():
+    # With VAD the last window ends at the last speech region, before the audio does
+    job = JobProgress("lecture")
+    job.update({"stage": "whisper", "audio_sec": 440.0, "total_sec": 500.0})
+    assert job.whisper_done is None
+    job.update({"stage": "whisper", "audio_sec": 500.0, "total_sec": 500.0, "done": True})
+    job.update({"stage": "llm", "chunks_done": 2, "tokens": 100})
+    assert job.whisper_done is not None
+    assert job.eta() is not None
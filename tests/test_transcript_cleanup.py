@@ -0,0 +1,21 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from transcript_cleanup import clean_transcript, TranscriptCleaner
+
+
+def test_inline_hallucination_removed():
+    text, _ = clean_transcript("في نهاية المحاضرة ترجمة نانسي قنقر ثم نبدأ\n")
+    assert text == "في نهاية المحاضرة ثم نبدأ\n"
+
+
+def test_loop_across_pieces_collapsed():
+    loop = "وهنا نكرر الجملة هنا. "
+    cleaner = TranscriptCleaner()
+    first, _ = cleaner.clean("intro. " + loop * 2 + "\n")
+    second, _ = cleaner.clean(loop * 3 + "next part\n")
+    assert first == "intro. " + (loop * 2).strip() + "\n"
+    assert second == "next part\n"
+    assert cleaner.stats["removed_tokens"] > 0
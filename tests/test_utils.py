@@ -0,0 +1,53 @@
+# Run with: python -m pytest -q
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils import split_into_token_chunks, estimate_tokens
+
+
+def test_token_chunks_at_budget_boundary():
+    # The last part fits on its own but not after the joining space; this used to recurse forever
+    text = "aaaa bbbb cccc dddd eeee fffff"
+    chunks = split_into_token_chunks(text, 10)
+    assert " ".join(chunks).split() == text.split()
+    assert all(estimate_tokens(" " + chunk) <= 10 for chunk in chunks if len(chunk.split()) > 1)
+
+
+def test_token_chunks_every_small_budget():
+    text = "one two three, four five six; seven eight nine ten. eleven twelve"
+    for budget in range(1, 30):
+        chunks = split_into_token_chunks(text, budget)
+        assert " ".join(chunks).split() == text.split()
+
+
+def test_clip_to_token_budget_counts_each_line_once():
+    from utils import clip_to_token_budget
+    calls = []
+
+    def counting(text):
+        calls.append(text)
+        return estimate_tokens(text)
+
+    text = "\n".join(f"- bullet number {i}" for i in range(20000))
+    clipped = clip_to_token_budget(text, 500, counting)
+    assert estimate_tokens(clipped) <= 500
+    assert text.startswith(clipped) and len(clipped.splitlines()) > 1
+    assert len(calls) < 1000  # Not one full-text count per dropped line
+    single = clip_to_token_budget("x" * 100, 10)
+    assert single and estimate_tokens(single) <= 10
+
+
+def test_merge_overlapping_text_keeps_single_repeated_word():
+    from utils import merge_overlapping_text
+    assert merge_overlapping_text("ذهبنا إلى المدرسة في", "في الصباح") == "في الصباح"
+    assert merge_overlapping_text("the gradient of the loss", "of the loss is zero") == "is zero"
+
+
+def test_tail_to_token_budget_clips_a_word_longer_than_the_budget():
+    from utils import tail_to_token_budget
+    tail = tail_to_token_budget("x" * 1000, 10)
+    assert tail and estimate_tokens(tail) <= 10
+    assert tail_to_token_budget("first sentence. " + "y" * 1000, 10).endswith("y")
@@ -0,0 +1,138 @@
+# tracing.py
+#
+# Lightweight per-stage instrumentation. Each lecture gets a JSON-lines trace
+# (Lecture_Outputs/<course>/<lecture>/trace.jsonl) with one record per span:
+# wall time, process CPU %, RSS and stage-specific counts such as prompt and
+# completion tokens. Spans are no-ops (apart from timing) when no trace is active.
+
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+import psutil
+
+TRACE_NAME = "trace.jsonl"
+
+_process = psutil.Process()
+_local = threading.local()  # Active tracer per thread
+_debug = os.environ.get("LECTURE_STUDIO_DEBUG") == "1"
+
+
+class Tracer:
+    """Appends span records for one lecture (or course) to a JSON-lines file."""
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.file = open(path, "a", encoding="utf-8")
+
+    def record(self, name, duration_sec, cpu_sec=None, **attrs):
+        """Writes one span record. `cpu_sec` is process CPU time spent during the span."""
+        entry = {
+            "ts": datetime.now().isoformat(timespec="milliseconds"),
+            "span": name,
+            "duration_sec": round(duration_sec, 4),
+            "rss_mb": round(_process.memory_info().rss / (1024 * 1024), 1)
+        }
+        if cpu_sec is not None and duration_sec > 0:
+            entry["cpu_percent"] = round(100.0 * cpu_sec / duration_sec, 1)  # 100 = one full core
+        if "completion_tokens" in attrs and "tokens_per_sec" not in attrs and duration_sec > 0:
+            attrs["tokens_per_sec"] = round(attrs["completion_tokens"] / duration_sec, 2)
+        entry.update(attrs)
+
+        line = json.dumps(entry, ensure_ascii=False)
+        with self.lock:
+            if self.file:
+                self.file.write(line + "\n")
+                self.file.flush()
+        debug_log(f"[TRACE] {line}")
+
+    def close(self):
+        with self.lock:
+            if self.file:
+                self.file.close()
+                self.file = None
+
+
+def start_trace(output_dir):
+    """Opens the trace file in output_dir and makes it the active tracer for this thread."""
+    tracer = Tracer(os.path.join(output_dir, TRACE_NAME))
+    bind_tracer(tracer)
+    return tracer
+
+
+def bind_tracer(tracer):
+    """Makes an existing tracer active in the current thread (e.g. a worker thread)."""
+    _local.tracer = tracer
+
+
+def current_tracer():
+    return getattr(_local, "tracer", None)
+
+
+@contextmanager
+def trace_to(output_dir):
+    """
+    Traces the block into output_dir unless this thread already has an active
+    tracer (then spans keep going to that one). A tracer opened here is closed
+    and unbound on exit.
+    """
+    tracer = current_tracer()
+    if tracer is not None:
+        yield tracer
+        return
+
+    tracer = start_trace(output_dir)
+    try:
+        yield tracer
+    finally:
+        tracer.close()
+        _local.tracer = None
+
+
+def _cpu_time():
+    times = _process.cpu_times()
+    return times.user + times.system
+
+
+@contextmanager
+def span(name, **attrs):
+    """
+    Times a block and records it on the active tracer. The yielded dict can be
+    filled with extra fields (token counts etc.) inside the block.
+    """
+    started = time.perf_counter()
+    cpu_started = _cpu_time()
+    try:
+        yield attrs
+    finally:
+        tracer = current_tracer()
+        if tracer:
+            tracer.record(name, time.perf_counter() - started, _cpu_time() - cpu_started, **attrs)
+
+
+def record_span(name, duration_sec, **attrs):
+    """Records a span measured elsewhere (e.g. work done in a worker process)."""
+    tracer = current_tracer()
+    if tracer:
+        tracer.record(name, duration_sec, **attrs)
+
+
+def set_debug(enabled):
+    """Turns debug output on or off for the whole app."""
+    global _debug
+    _debug = bool(enabled)
+
+
+def is_debug():
+    return _debug
+
+
+def debug_log(message):
+    """Prints a debug message when debugging is enabled."""
+    if _debug:
+        print(message)
@@ -0,0 +1,177 @@
+# transcript_cleanup.py
+#
+# Cleans Whisper output before it is chunked for the LLM. Whisper (medium in
+# particular) falls into repetition loops on long or noisy Arabic audio, e.g.
+# the same sentence 20 times in a row, and emits stock hallucinations such as
+# "ترجمة نانسي قنقر" on silence. Every repeated word would otherwise be paid for
+# as prompt tokens and translated again.
+#
+# The pass is linear in the transcript length: words are hashed once into
+# prefix hashes, so comparing any two spans is O(1), and each position tries a
+# bounded number of span lengths (MAX_SPAN_WORDS).
+
+import re
+
+from utils import estimate_tokens
+
+MAX_SPAN_WORDS = 24     # Longest repeated unit detected (a typical looping sentence)
+MIN_REPEATS = 3         # Back-to-back copies before a span is collapsed ("very very" is left alone)
+LONG_SPAN_WORDS = 6     # Spans at least this long are collapsed from 2 copies on
+CONTEXT_WORDS = MAX_SPAN_WORDS * MIN_REPEATS  # Words of the previous piece kept to catch loops across pieces
+
+# Phrases Whisper produces on silence or music; removed wherever they appear as whole words
+HALLUCINATIONS = [
+    "ترجمة نانسي قنقر",
+    "اشتركوا في القناة",
+    "شكرا للمشاهدة",
+    "Thanks for watching!",
+    "Thank you for watching.",
+    "Subtitles by the Amara.org community"
+]
+
+_HASH_BASE = 1_000_003
+_HASH_MOD = (1 << 61) - 1
+
+INVISIBLE = re.compile("[\u200b-\u200f\u061c\ufeff\u0640]")  # Zero-width/bidi marks and tatweel
+SPACE_BEFORE_PUNCT = re.compile(r"\s+([.,!?;:،؛؟…])")
+REPEATED_PUNCT = re.compile(r"([.,!?;:،؛؟])\1+")
+ELLIPSIS = re.compile(r"\.{3,}|…+")
+WORD_KEY = re.compile(r"[^\w]+")
+HALLUCINATION = re.compile("|".join(rf"(?<!\w){re.escape(p)}(?!\w)" for p in HALLUCINATIONS))
+
+
+def normalize_text(text):
+    """Strips invisible characters, unifies punctuation and collapses spaces; keeps line breaks."""
+    text = INVISIBLE.sub("", text)
+    text = ELLIPSIS.sub("…", text)
+    text = REPEATED_PUNCT.sub(r"\1", text)
+    # Segments of a window are joined into one line, so phrases are matched inside lines too
+    text = HALLUCINATION.sub(" ", text)
+    lines = []
+    for line in text.splitlines():
+        line = SPACE_BEFORE_PUNCT.sub(r"\1", " ".join(line.split()))
+        if line:
+            lines.append(line)
+    return "\n".join(lines)
+
+
+def collapse_repeats(words, max_span=MAX_SPAN_WORDS, protected=0):
+    """
+    Replaces back-to-back copies of a span of words with a single copy.
+
+    Words are compared without punctuation or case, so "loop، loop loop." counts
+    as three copies. Rolling (prefix) hashes make each span comparison O(1).
+    The first `protected` words (context already emitted) are always kept, but
+    still count as copies, so a loop continuing after them is dropped.
+
+    Returns:
+        tuple: (kept words, number of spans collapsed)
+    """
+    keys = [WORD_KEY.sub("", w).lower() or w for w in words]
+    ids = {}
+    prefix = [0] * (len(keys) + 1)
+    powers = [1] * (len(keys) + 1)
+    for i, key in enumerate(keys):
+        prefix[i + 1] = (prefix[i] * _HASH_BASE + ids.setdefault(key, len(ids) + 1)) % _HASH_MOD
+        powers[i + 1] = powers[i] * _HASH_BASE % _HASH_MOD
+
+    def span_hash(start, length):
+        return (prefix[start + length] - prefix[start] * powers[length]) % _HASH_MOD
+
+    def same(a, b, length):
+        # Hash first; compare the words only on a hash match to rule out collisions
+        return span_hash(a, length) == span_hash(b, length) and keys[a:a + length] == keys[b:b + length]
+
+    kept = []
+    collapsed = 0
+    i = 0
+    n = len(words)
+    while i < n:
+        for length in range(1, min(max_span, (n - i) // 2) + 1):
+            if not same(i, i + length, length):
+                continue
+            copies = 2
+            while i + (copies + 1) * length <= n and same(i, i + copies * length, length):
+                copies += 1
+            if copies >= MIN_REPEATS or length >= LONG_SPAN_WORDS:
+                end = i + copies * length
+                kept.extend(words[i:max(i + length, min(protected, end))])
+                collapsed += 1
+                i = max(end, i + length)
+                break
+        else:
+            kept.append(words[i])
+            i += 1
+    return kept, collapsed
+
+
+def _join_words(words):
+    lines = [[]]
+    for word in words:
+        if word == "\n":
+            lines.append([])
+        else:
+            lines[-1].append(word)
+    return "\n".join(" ".join(line) for line in lines if line)
+
+
+class TranscriptCleaner:
+    """
+    Cleans a transcript given in pieces (e.g. streamed Whisper windows). The
+    tail of the previous piece is carried into the next pass, so loops that
+    cross a piece boundary are collapsed too. `stats` sums over all pieces.
+    """
+
+    def __init__(self, count_tokens=estimate_tokens):
+        self.count_tokens = count_tokens
+        self.context = []
+        self.stats = {"tokens_before": 0, "tokens_after": 0, "removed_tokens": 0, "collapsed_spans": 0}
+
+    def clean(self, text):
+        """
+        Returns:
+            tuple: (clean text, stats dict of this piece with tokens_before,
+                    tokens_after, removed_tokens and collapsed_spans)
+        """
+        tokens_before = self.count_tokens(text) if text.strip() else 0
+        # Line breaks are kept as words of their own, so loops spanning lines are found too
+        words = re.findall(r"[^\s]+|\n", normalize_text(text))
+        if words and text.endswith("\n"):
+            words.append("\n")
+        kept, collapsed = collapse_repeats(self.context + words, protected=len(self.context))
+        new = kept[len(self.context):]
+        self.context = (self.context + new)[-CONTEXT_WORDS:]
+        while self.context and self.context[-1] == "\n":
+            self.context.pop()  # The break between pieces must not stop a loop from matching across it
+
+        cleaned = _join_words(new)
+        if new and new[-1] == "\n":
+            cleaned += "\n"
+        tokens_after = self.count_tokens(cleaned) if cleaned.strip() else 0
+        stats = {
+            "tokens_before": tokens_before,
+            "tokens_after": tokens_after,
+            "removed_tokens": tokens_before - tokens_after,
+            "collapsed_spans": collapsed
+        }
+        for key, value in stats.items():
+            self.stats[key] += value
+        return cleaned, stats
+
+
+def clean_transcript(text, count_tokens=estimate_tokens):
+    """
+    Normalizes a whole transcript and collapses repetition loops, keeping line breaks.
+
+    Returns:
+        tuple: (clean text, stats dict with tokens_before, tokens_after,
+                removed_tokens and collapsed_spans)
+    """
+    return TranscriptCleaner(count_tokens).clean(text)
+
+
+def report_cleanup(stats):
+    """One-line summary of (summed) cleanup stats."""
+    share = 100.0 * stats["removed_tokens"] / stats["tokens_before"] if stats["tokens_before"] else 0.0
+    return (f"[CLEANUP] Removed {stats['removed_tokens']} of {stats['tokens_before']} tokens ({share:.1f}%), "
+            f"{stats['collapsed_spans']} repeated spans collapsed")
@@ -18,19 +18,195 @@ def split_into_chunks(transcript_text, max_chunk_size=1800):
 
     return chunks
 
+# Sentence ends (incl. Arabic question mark) and line breaks, then softer pauses
+SENTENCE_END = re.compile(r"(?<=[.!?؟…])\s+|\n+")
+PAUSE = re.compile(r"(?<=[,،;؛:])\s+")
+
+def estimate_tokens(text):
+    """Rough token count when no tokenizer is available (~3 chars per token)."""
+    return max(1, (len(text) + 2) // 3)
+
+def _split_oversized(sentence, count_tokens, token_budget):
+    # A "sentence" longer than the budget is cut at pauses, then at words.
+    # Parts are counted as iter_token_chunks counts them: mid-chunk, after a space.
+    pieces = []
+    for part in PAUSE.split(sentence):
+        n = count_tokens(" " + part)
+        if n <= token_budget:
+            pieces.append(part)
+            continue
+        words = part.split()
+        step = max(1, len(words) * token_budget // n)
+        pieces.extend(" ".join(words[i:i + step]) for i in range(0, len(words), step))
+    return pieces
+
+def iter_token_chunks(text_pieces, token_budget, count_tokens=estimate_tokens, overlap_tokens=0):
+    """
+    Packs transcript text into chunks of at most `token_budget` tokens,
+    cutting at sentence (or pause) boundaries.
+
+    Each sentence is tokenized exactly once, so this stays linear on multi-hour
+    transcripts. `text_pieces` is any iterable of text (e.g. streamed transcript
+    windows); chunks are yielded as soon as they are full.
+
+    Args:
+        text_pieces (iterable): Pieces of transcript text, in order
+        token_budget (int): Max tokens of transcript per chunk
+        count_tokens (callable): Returns the token count of a string
+        overlap_tokens (int): Tokens of trailing sentences repeated at the start of the next chunk
+    """
+    current = []          # (sentence, tokens) in the chunk being built
+    current_tokens = 0
+    carry = ""            # Unfinished sentence at the end of the last piece
+
+    def add(sentence):
+        nonlocal current, current_tokens
+        n = count_tokens(" " + sentence)  # Counted as it appears mid-chunk, after a space
+        if n > token_budget and len(sentence.split()) > 1:
+            parts = _split_oversized(sentence, count_tokens, token_budget)
+            if parts == [sentence]:
+                # No cut found (e.g. the estimate rounds just under the budget): halve by words
+                words = sentence.split()
+                parts = [" ".join(words[:len(words) // 2]), " ".join(words[len(words) // 2:])]
+            for part in parts:
+                yield from add(part)
+            return
+        if current and current_tokens + n > token_budget:
+            yield " ".join(s for s, _ in current)
+            # Seed the next chunk with trailing sentences for continuity
+            kept, kept_tokens = [], 0
+            for s, t in reversed(current):
+                if kept_tokens + t > overlap_tokens or kept_tokens + t + n > token_budget:
+                    break
+                kept.insert(0, (s, t))
+                kept_tokens += t
+            current, current_tokens = kept, kept_tokens
+        current.append((sentence, n))
+        current_tokens += n
+
+    for piece in text_pieces:
+        parts = SENTENCE_END.split(carry + piece)
+        carry = parts.pop()
+        for sentence in parts:
+            if sentence.strip():
+                yield from add(sentence.strip())
+
+    if carry.strip():
+        yield from add(carry.strip())
+    if current:
+        yield " ".join(s for s, _ in current)
+
+def split_into_token_chunks(transcript_text, token_budget, count_tokens=estimate_tokens, overlap_tokens=0):
+    """List version of iter_token_chunks for a complete transcript."""
+    return list(iter_token_chunks([transcript_text], token_budget, count_tokens, overlap_tokens))
+
+def clip_to_token_budget(text, max_tokens, count_tokens=estimate_tokens):
+    """
+    Drops trailing lines (then characters) until text fits in max_tokens.
+    Used to keep the previous-chunk summary inside its reserved budget.
+    """
+    lines = text.strip().splitlines()
+    if not lines or count_tokens("\n".join(lines)) <= max_tokens:
+        return "\n".join(lines)
+
+    # Each line is counted once; the cut goes where the running total passes the budget
+    used = 0
+    keep = 0
+    for i, line in enumerate(lines):
+        used += count_tokens(line if i == 0 else "\n" + line)
+        if used > max_tokens:
+            break
+        keep = i + 1
+    lines = lines[:max(keep, 1)]
+    # Exact check on the joined text (tokens can merge across joins); rarely more than one step
+    while len(lines) > 1 and count_tokens("\n".join(lines)) > max_tokens:
+        lines.pop()
+    while lines and count_tokens(lines[0]) > max_tokens:
+        line = lines[0]
+        lines[0] = line[:len(line) * max_tokens // count_tokens(line) - 1]
+        if not lines[0]:
+            lines = []
+    return "\n".join(lines)
+
+def tail_to_token_budget(text, max_tokens, count_tokens=estimate_tokens):
+    """
+    Keeps the last sentences (then words) of text that fit in max_tokens.
+    Used as context taken from the end of the previous transcript chunk.
+    """
+    sentences = [s for s in SENTENCE_END.split(text.strip()) if s.strip()]
+    kept = []
+    used = 0
+    for sentence in reversed(sentences):
+        cost = count_tokens(" " + sentence)
+        if used + cost <= max_tokens:
+            kept.append(sentence)
+            used += cost
+            continue
+        if not kept:
+            # A single long sentence: keep its trailing words
+            words = sentence.split()
+            while words and count_tokens(" ".join(words)) > max_tokens:
+                words = words[len(words) // 4 or 1:] if count_tokens(" ".join(words)) > 2 * max_tokens else words[1:]
+            if not words:
+                # A single word longer than the budget: keep its trailing characters
+                tail = sentence.split()[-1]
+                while tail and count_tokens(tail) > max_tokens:
+                    keep = len(tail) * max_tokens // count_tokens(tail) - 1
+                    tail = tail[-keep:] if keep > 0 else ""
+                words = [tail]
+            kept.append(" ".join(words))
+        break
+    return " ".join(reversed(kept)).strip()
+
 def extract_key_summary(note_text, max_bullets=3):
     """
     Extract a short bullet-point summary from Key Takeaways section
     """
-    pattern = r"(?<=### \*\*Key Takeaways\*\*)([\s\S]+?)(?=(###|$))"
-    match = re.search(pattern, note_text)
-    if not match:
-        return ""
+    # Matched loosely, so "### 🧠 Key Takeaways" (as prompted) and "### **Key Takeaways**" both work
+    bullets = split_note_sections(note_text).get("key_takeaways", [])
+    return "\n".join(f"- {b}" for b in bullets[:max_bullets])
+
+# Note sections in prompt order: (sidecar key, heading the model is asked to write)
+NOTE_SECTIONS = [
+    ("key_takeaways", "### 🧠 Key Takeaways"),
+    ("definitions", "### 📘 Definitions & Terms"),
+    ("importance", "### 🔍 Inferred Importance"),
+    ("exam_alerts", "### 🎯 Exam Alerts"),
+    ("questions", "### 📝 Potential Exam Questions")
+]
+EXAM_NOTE_SECTIONS = ("exam_alerts", "questions")
+
+def note_sections(include_exam=True):
+    return [(key, heading) for key, heading in NOTE_SECTIONS if include_exam or key not in EXAM_NOTE_SECTIONS]
+
+# Note section headings (matched loosely: emoji and ** are ignored) -> sidecar keys
+SECTION_KEYS = {
+    "key takeaways": "key_takeaways",
+    "definitions": "definitions",
+    "importance": "importance",
+    "exam alerts": "exam_alerts",
+    "exam questions": "questions"
+}
+
+def split_note_sections(note_text):
+    """
+    Splits generated notes into their sections.
 
-    raw = match.group(1)
-    bullets = re.findall(r"[-\*]\s+(.+)", raw)
-    summary = bullets[:max_bullets]
-    return "\n".join(f"- {b}" for b in summary)
+    Returns:
+        dict: section key (see SECTION_KEYS) -> list of bullet texts
+    """
+    sections = {}
+    current = None
+    for line in note_text.splitlines():
+        heading = re.match(r"\s*#{2,4}\s*(.+)", line)
+        if heading:
+            title = re.sub(r"[^\w\s&]", "", heading.group(1)).lower()
+            current = next((key for name, key in SECTION_KEYS.items() if name in title), None)
+            continue
+        if current and line.strip():
+            item = re.match(r"\s*(?:[-*•]|\d+[.)])\s+(.+)", line)
+            sections.setdefault(current, []).append((item.group(1) if item else line).strip())
+    return sections
 
 def score_chunk_for_importance(note_text):
     """
@@ -43,7 +219,13 @@ def score_chunk_for_importance(note_text):
     score += note_text.count("- ")      # Key Takeaways
     return score
 
-def prepare_contextual_prompt(chunk, previous_chunk=None, include_exam=True, translate_to_english=False):
+def build_prompt_prefix(include_exam=True, translate_to_english=False):
+    """
+    Static head of every chunk prompt (system header + section instructions).
+
+    It is identical for all chunks of a lecture, so its KV state can be evaluated
+    once and reused (see prefix_cache.py). Keep anything chunk-specific out of it.
+    """
     system_header = "You are an academic assistant."
 
     if translate_to_english:
@@ -54,32 +236,44 @@ def prepare_contextual_prompt(chunk, previous_chunk=None, include_exam=True, tra
     else:
         system_header += " Generate structured Markdown notes from a university lecture transcript."
 
-    section_instructions = [
-        "### 🧠 Key Takeaways",
-        "### 📘 Definitions & Terms",
-        "### 🔍 Inferred Importance"
-    ]
+    section_instructions = [heading for _, heading in note_sections(include_exam)]
 
-    if include_exam:
-        section_instructions += [
-            "### 🎯 Exam Alerts",
-            "### 📝 Potential Exam Questions"
-        ]
+    return f"""[INST] <<SYS>>
+{system_header}
+Write the notes using these sections:
+
+{chr(10).join(section_instructions)}
+<</SYS>>
+"""
+
+def prepare_contextual_prompt(chunk, previous_chunk=None, include_exam=True, translate_to_english=False):
+    prefix = build_prompt_prefix(include_exam, translate_to_english)
 
     context_instruction = ""
     if previous_chunk:
-        context_instruction = f"\n\nContext from previous segment:\n{previous_chunk.strip()}"
-
-    prompt = f"""[INST] <<SYS>>
-{system_header}
-<</SYS>>
+        context_instruction = f"\nContext from previous segment:\n{previous_chunk.strip()}\n"
 
+    prompt = f"""{prefix}{context_instruction}
 --- Transcript Chunk Start ---
 {chunk.strip()}
 --- End ---
-{context_instruction}
-
-{chr(10).join(section_instructions)}
 [/INST]
 """
     return prompt
+
+def merge_overlapping_text(previous_text, next_text, max_overlap_words=30, min_overlap_words=3):
+    """
+    Drops the words at the start of next_text that repeat the end of previous_text.
+
+    Used when stitching transcripts of overlapping audio windows. Shorter
+    matches than min_overlap_words are kept: a single repeated word such as
+    "في" at a join is far more likely real speech than a duplicate.
+    """
+    prev_words = previous_text.split()
+    next_words = next_text.split()
+    limit = min(max_overlap_words, len(prev_words), len(next_words))
+
+    for n in range(limit, min_overlap_words - 1, -1):
+        if prev_words[-n:] == next_words[:n]:
+            return " ".join(next_words[n:])
+    return next_text.strip()
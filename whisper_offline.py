@@ -1,13 +1,37 @@
+import hashlib
 import json
-import psutil
+import time
 from datetime import datetime
 import subprocess  # Allows us to run external programs like Whisper
 import os           # File checking and filesystem operations
+import tempfile
+from concurrent.futures import FIRST_COMPLETED, wait
+import numpy as np
 from tqdm import tqdm  # tqdm is used to display a progress bar in the terminal
+from audio_utils import (
+    SAMPLE_RATE,
+    decode_audio,
+    frame_energy,
+    detect_speech,
+    build_speech_map,
+    compact_energies,
+    gather_samples,
+    to_original_sample,
+    plan_windows_from_energies,
+    to_float32,
+    write_wav
+)
+from utils import merge_overlapping_text
+from tracing import span, record_span
+from inference_profile import whisper_settings
+from worker_pool import WorkerPool
 
 # Global variable to keep track of Whisper's process
 whisper_proc = None
 
+# Live worker pools (one per running job) so an emergency stop can terminate them
+whisper_pools = set()
+
 # Global flag to interrupt long processing (Mistral later)
 abort_flag = False
 
@@ -16,79 +40,367 @@ LANGUAGE_CODE_MAP = {
     "English": "en"
 }
 
-def transcribe_audio(audio_path, lang_mode="Arabic"):
+# Engine configuration
+WHISPER_ENGINE = "faster"   # "faster" = in-process faster-whisper, "cli" = whisper command per window
+WHISPER_MODEL = "medium"
+COMPUTE_TYPE = "int8"       # "int8" or "float32" on CPU
+BEAM_SIZE = 5
+# Threads per worker and worker count come from the calibrated profile if there is one
+CPU_THREADS, _profile_workers = whisper_settings(WHISPER_MODEL, COMPUTE_TYPE, 3)
+
+# Segmentation configuration
+WINDOW_SEC = 120            # Target window length; cuts snap to the nearest silence
+WHISPER_WORKERS = _profile_workers or max(1, (os.cpu_count() or 1) // CPU_THREADS)
+
+# Preprocessing configuration
+VAD_ENABLED = True          # Transcribe only speech regions; silence, breaks and noise are skipped
+MIN_SPEECH_COVERAGE = 0.05  # Less detected speech than this share of the audio is treated as a VAD failure
+PCM_MMAP = False            # Memory-map decoded PCM from a cache file instead of holding it in RAM
+PCM_CACHE_DIR = os.path.join("Lecture_Outputs", ".pcm_cache")
+
+# faster-whisper model, loaded once per process and reused between calls
+_whisper_model = None
+_whisper_model_key = None
+
+# Callable building a model like faster_whisper.WhisperModel; None means the real one.
+# Swapped out by the benchmark harness to run with a stand-in engine.
+_whisper_factory = None
+
+
+def set_whisper_factory(factory):
+    """Replaces the WhisperModel constructor used for new loads (None restores faster-whisper)."""
+    global _whisper_factory, _whisper_model
+    _whisper_factory = factory
+    _whisper_model = None
+
+
+def get_whisper_model(model_size=WHISPER_MODEL, compute_type=COMPUTE_TYPE, cpu_threads=CPU_THREADS):
+    """
+    Returns the faster-whisper model for this process, loading it on first use.
+
+    The model is only reloaded if the size, compute type or thread count changes.
+    """
+    global _whisper_model, _whisper_model_key
+
+    key = (model_size, compute_type, cpu_threads)
+    if _whisper_model is None or _whisper_model_key != key:
+        if _whisper_factory is not None:
+            WhisperModel = _whisper_factory
+        else:
+            from faster_whisper import WhisperModel  # Imported lazily so the CLI engine works without it
+        print(f"[WHISPER] Loading faster-whisper '{model_size}' ({compute_type}, {cpu_threads} threads)")
+        _whisper_model = WhisperModel(
+            model_size,
+            device="cpu",
+            compute_type=compute_type,
+            cpu_threads=cpu_threads
+        )
+        _whisper_model_key = key
+    return _whisper_model
+
+
+def stream_segments(audio, whisper_lang="ar", compute_type=COMPUTE_TYPE, cpu_threads=CPU_THREADS, beam_size=BEAM_SIZE):
+    """
+    Yields faster-whisper segments for an audio file (or array) as they are decoded.
+
+    Stops early if an abort was requested.
     """
-    Runs Whisper from the command line to transcribe an MP3 file in segments.
+    model = get_whisper_model(WHISPER_MODEL, compute_type, cpu_threads)
+    segments, _ = model.transcribe(
+        audio,
+        language=whisper_lang,
+        task="transcribe",
+        beam_size=beam_size
+    )
+    for segment in segments:  # Lazy generator: decoding happens while we iterate
+        if should_abort():
+            print("[WHISPER] Aborting transcription due to shutdown.")
+            break
+        yield segment
 
-    Uses checkpoints and temp trimming to resume safely on crash/failure.
+
+def transcribe_audio(
+    audio_path,
+    lang_mode="Arabic",
+    engine=WHISPER_ENGINE,
+    compute_type=COMPUTE_TYPE,
+    cpu_threads=CPU_THREADS,
+    beam_size=BEAM_SIZE,
+    workers=WHISPER_WORKERS,
+    window_sec=WINDOW_SEC
+):
+    """
+    Transcribes an MP3 file with Whisper.
+
+    The audio is decoded once to 16 kHz mono PCM, reduced to its speech regions
+    (VAD_ENABLED) and cut into silence-aligned windows, which are transcribed across a pool of worker processes and stitched
+    back together in order. Finished windows are checkpointed so a crash resumes
+    from the first missing window.
 
     Args:
         audio_path (str): Path to the input audio file.
         lang_mode (str): "Arabic" or "English".
+        engine (str): "faster" (faster-whisper) or "cli" (whisper command).
+        compute_type (str): faster-whisper compute type ("int8" or "float32").
+        cpu_threads (int): CPU threads used by each Whisper worker.
+        beam_size (int): Beam size for decoding (faster engine only).
+        workers (int): Number of worker processes (faster engine only).
+        window_sec (int): Target window length in seconds.
 
     Returns:
         tuple: (transcript_text, english_placeholder, metadata_json)
     """
-    global whisper_proc
+    lines = []
+    segments_meta = []
+    duration = 0.0
+
+    for window in iter_window_transcripts(audio_path, lang_mode, engine, compute_type,
+                                          cpu_threads, beam_size, workers, window_sec):
+        if window is None:  # Aborted before the last window
+            break
+        duration = window["duration"]
+        if window["text"]:
+            lines.append(window["text"])
+        segments_meta.extend(window["segments"])
+
+    combined_text = "\n".join(lines) + "\n"
+    metadata = {"engine": engine, "model": WHISPER_MODEL, "duration": duration, "segments": segments_meta}
+    return combined_text, "", json.dumps(metadata, ensure_ascii=False)
+
+
+def iter_window_transcripts(
+    audio_path,
+    lang_mode="Arabic",
+    engine=WHISPER_ENGINE,
+    compute_type=COMPUTE_TYPE,
+    cpu_threads=CPU_THREADS,
+    beam_size=BEAM_SIZE,
+    workers=WHISPER_WORKERS,
+    window_sec=WINDOW_SEC
+):
+    """
+    Yields the transcript of each audio window in order, as soon as it and all
+    earlier windows are done. Yields None once if the run was aborted. The
+    checkpoint is removed once the last window has been consumed.
 
+    Each item is a dict with index, start/end seconds, de-duplicated text and
+    absolute-timestamp segments. With VAD, windows are cut from the speech-only
+    audio and every timestamp is mapped back to the original recording.
+    """
     whisper_lang = LANGUAGE_CODE_MAP.get(lang_mode, "ar")
+    mmap_path = pcm_cache_path(audio_path) if PCM_MMAP else None
+
+    with span("whisper.decode") as attrs:
+        pcm = decode_audio(audio_path, mmap_path=mmap_path)
+        energies, frame_len = frame_energy(pcm)
+        speech_map = None
+        total = len(pcm)
+        if VAD_ENABLED:
+            speech_map = build_speech_map(detect_speech(energies, frame_len, len(pcm)))
+            if speech_map["total"] < MIN_SPEECH_COVERAGE * len(pcm):
+                print(f"[WHISPER] Warning: VAD found only {speech_map['total'] / SAMPLE_RATE:.0f}s of speech; "
+                      f"transcribing the full audio instead")
+                speech_map = None
+            else:
+                energies = compact_energies(energies, speech_map, frame_len)
+                total = speech_map["total"]
+        windows = plan_windows_from_energies(energies, frame_len, total, window_sec=window_sec)
+        attrs.update(audio_sec=round(len(pcm) / SAMPLE_RATE, 1), speech_sec=round(total / SAMPLE_RATE, 1),
+                     windows=len(windows))
+    print(f"[WHISPER] {len(pcm) / SAMPLE_RATE:.0f}s of audio ({total / SAMPLE_RATE:.0f}s speech) "
+          f"in {len(windows)} windows")
+
+    def window_samples(window):
+        if speech_map is None:
+            return np.asarray(pcm[window["start"]:window["end"]])  # Plain array, so a memmap pickles as data
+        return gather_samples(pcm, speech_map, window["start"], window["end"])
+
+    def original_sec(sample):
+        # Window positions are in speech-only samples when VAD is on
+        return (to_original_sample(sample, speech_map) if speech_map else sample) / SAMPLE_RATE
+
+    # Checkpoint system: reuse windows finished by a previous run of the same file
+    done = {}
+    checkpoint = load_whisper_checkpoint(audio_path)
+    if (checkpoint and checkpoint["audio_path"] == audio_path and checkpoint.get("lang") == lang_mode
+            and checkpoint.get("window_sec") == window_sec and checkpoint.get("vad", False) == VAD_ENABLED
+            and checkpoint.get("source") == audio_fingerprint(audio_path)):
+        done = {int(k): v for k, v in checkpoint.get("windows", {}).items()}
+        if done:
+            print(f"[RESUME] Reusing {len(done)} finished windows from checkpoint")
+
+    def finish(index, raw_segments):
+        # Keep segments centred inside this window's own span; the overlap belongs to the neighbour
+        window = windows[index]
+        lo = window["start"]
+        hi = window["cut"] if index < len(windows) - 1 else float("inf")
+        kept = []
+        for start, end, text in raw_segments:
+            start, end = lo + start * SAMPLE_RATE, lo + end * SAMPLE_RATE
+            if lo <= (start + end) / 2 < hi and text:
+                kept.append({"start": round(original_sec(start), 2), "end": round(original_sec(end), 2), "text": text})
+        done[index] = {"segments": kept}
+        save_whisper_checkpoint(audio_path, lang_mode, original_sec(window["cut"]), done, window_sec)
+
+    previous_text = ""
+    next_index = 0
 
-    # Checkpoint system
-    checkpoint = load_whisper_checkpoint()
-    if checkpoint and checkpoint["audio_path"] == audio_path:
-        resume_from = checkpoint.get("last_offset_sec", 0)
-        if resume_from > 0:
-            audio_path = trim_audio_from_offset(audio_path, resume_from)
-            print(f"[RESUME] Trimming audio from {resume_from} seconds")
-    else:
-        resume_from = 0
-
-    segment_duration = 120  # seconds per chunk
-    current_offset = resume_from
-    part_index = 1
-    combined_text = ""
-
-    with tqdm(desc="[WHISPER] Transcription Progress", bar_format="{l_bar}{bar} {n_fmt} chunks") as pbar:
-        while True:
-            save_whisper_checkpoint(audio_path, lang_mode, current_offset)
-            output_txt = f"transcript_part_{part_index:03}.txt"
-
-            transcribe_cmd = [
-                "whisper", audio_path,
-                "--model", "medium",
-                "--language", whisper_lang,
-                "--task", "transcribe",
-                "--output_format", "txt",
-                "--output_dir", ".",
-                "--fp16", "False",
-                "--threads", "3"
-            ]
-
-            try:
-                whisper_proc = subprocess.Popen(transcribe_cmd)
-                whisper_proc.wait()
-            except Exception as e:
-                raise RuntimeError("Whisper failed to run") from e
-
-            if not os.path.exists("transcript.txt"):
-                raise RuntimeError("Expected Whisper output not found")
-
-            os.rename("transcript.txt", output_txt)
-            with open(output_txt, "r", encoding="utf-8") as f:
-                combined_text += f.read().strip() + "\n"
-
-            part_index += 1
-            current_offset += segment_duration
-            pbar.update(1)
-
-            # TEMPORARY limit until full audio duration is implemented
-            if current_offset > 600:
-                break
-
-    if os.path.exists("whisper_checkpoint.json"):
-        os.remove("whisper_checkpoint.json")
-
-    return combined_text, "", "{}"
+    def emit_ready():
+        # Release finished windows in order, stitching away repeated words at the joins
+        nonlocal previous_text, next_index
+        while next_index in done:
+            window = windows[next_index]
+            text = " ".join(s["text"] for s in done[next_index]["segments"])
+            text = merge_overlapping_text(previous_text, text) if previous_text else text.strip()
+            if text:
+                previous_text = text
+            yield {
+                "index": next_index,
+                "start": original_sec(window["start"]),
+                "end": original_sec(window["end"]),
+                "duration": len(pcm) / SAMPLE_RATE,
+                "text": text,
+                "segments": done[next_index]["segments"]
+            }
+            next_index += 1
+
+    pending = [i for i in range(len(windows)) if i not in done]
+
+    with tqdm(total=len(windows), initial=len(done), desc="[WHISPER] Transcription Progress", unit="window") as pbar:
+        yield from emit_ready()
+
+        if engine == "cli" or workers <= 1:
+            for index in pending:
+                if should_abort():
+                    yield None
+                    return
+                samples = window_samples(windows[index])
+                audio_sec = len(samples) / SAMPLE_RATE
+                with span("whisper.window", window=index, audio_sec=round(audio_sec, 1)) as attrs:
+                    started = time.perf_counter()
+                    if engine == "cli":
+                        raw = _transcribe_window_cli(samples, whisper_lang, cpu_threads)
+                    else:
+                        raw = [(s.start, s.end, s.text.strip())
+                               for s in stream_segments(to_float32(samples), whisper_lang, compute_type,
+                                                        cpu_threads, beam_size)]
+                    attrs["segments"] = len(raw)
+                    attrs["rtf"] = round((time.perf_counter() - started) / audio_sec, 3) if audio_sec else None
+                if should_abort():  # Window may be incomplete
+                    yield None
+                    return
+                finish(index, raw)
+                pbar.update(1)
+                yield from emit_ready()
+            _remove_pcm_cache(mmap_path)
+            _remove_checkpoint(audio_path)
+            return
+
+        whisper_pool = WorkerPool(workers, _init_worker, (compute_type, cpu_threads))
+        whisper_pools.add(whisper_pool)
+        try:
+            in_flight = {}
+            queue = list(pending)
+            while queue or in_flight:
+                # Bound in-flight windows so PCM copies do not pile up in memory
+                while queue and len(in_flight) < workers * 2:
+                    index = queue.pop(0)
+                    samples = window_samples(windows[index])
+                    future = whisper_pool.submit(_transcribe_window, samples, whisper_lang,
+                                                 compute_type, cpu_threads, beam_size)
+                    in_flight[future] = index
+
+                finished, _ = wait(in_flight, timeout=0.5, return_when=FIRST_COMPLETED)
+                if should_abort():
+                    print("[WHISPER] Aborting transcription due to shutdown.")
+                    yield None
+                    return
+                for future in finished:
+                    index = in_flight.pop(future)
+                    raw, elapsed = future.result()
+                    # Work happened in a worker process, so only wall time is known here
+                    audio_sec = (windows[index]["end"] - windows[index]["start"]) / SAMPLE_RATE
+                    record_span("whisper.window", elapsed, window=index, audio_sec=round(audio_sec, 1),
+                                segments=len(raw), rtf=round(elapsed / audio_sec, 3) if audio_sec else None)
+                    finish(index, raw)
+                    pbar.update(1)
+                yield from emit_ready()
+            _remove_pcm_cache(mmap_path)
+            _remove_checkpoint(audio_path)
+        finally:
+            whisper_pools.discard(whisper_pool)
+            whisper_pool.shutdown(wait=False, cancel_futures=True)
+
+
+def pcm_cache_path(audio_path):
+    """Memory-mapped PCM file for an audio file; kept after an abort so a resume skips decoding."""
+    key = hashlib.sha256(os.path.abspath(audio_path).encode("utf-8")).hexdigest()[:16]
+    return os.path.join(PCM_CACHE_DIR, f"{key}.s16le")
+
+
+def _remove_pcm_cache(mmap_path):
+    if mmap_path and os.path.exists(mmap_path):
+        try:
+            os.remove(mmap_path)
+        except OSError:
+            pass  # Still mapped on Windows; reused or replaced by the next decode
+
+
+def _init_worker(compute_type, cpu_threads):
+    """Loads the model once when a worker process starts."""
+    get_whisper_model(WHISPER_MODEL, compute_type, cpu_threads)
+
+
+def _transcribe_window(samples, whisper_lang, compute_type, cpu_threads, beam_size):
+    """
+    Worker-process entry point: transcribes one int16 window.
+
+    Returns:
+        tuple: ((start, end, text) tuples relative to the window start, seconds spent)
+    """
+    started = time.perf_counter()
+    raw = [
+        (s.start, s.end, s.text.strip())
+        for s in stream_segments(to_float32(samples), whisper_lang, compute_type, cpu_threads, beam_size)
+    ]
+    return raw, time.perf_counter() - started
+
+
+def _transcribe_window_cli(samples, whisper_lang, cpu_threads):
+    """
+    Runs the whisper command on one window written to a temporary WAV file.
+    """
+    global whisper_proc
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        wav_path = write_wav(os.path.join(tmp_dir, "window.wav"), samples)
+        transcribe_cmd = [
+            "whisper", wav_path,
+            "--model", WHISPER_MODEL,
+            "--language", whisper_lang,
+            "--task", "transcribe",
+            "--output_format", "json",
+            "--output_dir", tmp_dir,
+            "--fp16", "False",
+            "--threads", str(cpu_threads)
+        ]
+
+        try:
+            whisper_proc = subprocess.Popen(transcribe_cmd)
+            whisper_proc.wait()
+        except Exception as e:
+            raise RuntimeError("Whisper failed to run") from e
+
+        output_json = os.path.join(tmp_dir, "window.json")
+        if not os.path.exists(output_json):
+            if should_abort():
+                return []
+            raise RuntimeError("Expected Whisper output not found")
+
+        with open(output_json, "r", encoding="utf-8") as f:
+            result = json.load(f)
+
+    return [(s["start"], s["end"], s["text"].strip()) for s in result.get("segments", [])]
 
 
 def kill_whisper():
@@ -98,6 +410,8 @@ def kill_whisper():
     global whisper_proc
     if whisper_proc and whisper_proc.poll() is None:
         whisper_proc.terminate()
+    for pool in list(whisper_pools):
+        pool.terminate()
 
 def set_abort_flag():
     """
@@ -111,30 +425,43 @@ def should_abort():
     Check whether an abort was requested. Called periodically in long loops.
     """
     return abort_flag
-def save_whisper_checkpoint(audio_path, lang_mode, offset):
+def save_whisper_checkpoint(audio_path, lang_mode, offset, windows=None, window_sec=WINDOW_SEC):
     checkpoint = {
         "audio_path": audio_path,
         "lang": lang_mode,
-        "model": "medium",
+        "model": WHISPER_MODEL,
         "last_offset_sec": offset,
+        "window_sec": window_sec,
+        "vad": VAD_ENABLED,
+        "source": audio_fingerprint(audio_path),
+        "windows": {str(k): v for k, v in (windows or {}).items()},
         "timestamp": datetime.now().isoformat()
     }
-    with open("whisper_checkpoint.json", "w", encoding="utf-8") as f:
-        json.dump(checkpoint, f, indent=2)
+    # Write to a temp file first so a crash never leaves a half-written checkpoint
+    path = checkpoint_path(audio_path)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(checkpoint, f, indent=2, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+def checkpoint_path(audio_path):
+    # One checkpoint per audio file, so concurrent jobs never overwrite each other's
+    key = hashlib.sha256(os.path.abspath(audio_path).encode("utf-8")).hexdigest()[:12]
+    return f"whisper_checkpoint_{key}.json"
 
-def load_whisper_checkpoint():
-    if os.path.exists("whisper_checkpoint.json"):
-        with open("whisper_checkpoint.json", "r", encoding="utf-8") as f:
+def audio_fingerprint(audio_path):
+    # Size + mtime, so windows of a replaced file with the same path are not reused
+    st = os.stat(audio_path)
+    return {"size": st.st_size, "mtime_ns": st.st_mtime_ns}
+
+def _remove_checkpoint(audio_path):
+    path = checkpoint_path(audio_path)
+    if os.path.exists(path):
+        os.remove(path)
+
+def load_whisper_checkpoint(audio_path):
+    path = checkpoint_path(audio_path)
+    if os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
             return json.load(f)
     return None
-
-def trim_audio_from_offset(original_path, offset_sec):
-    trimmed_path = ".temp_resume_trim.mp3"
-    cmd = [
-        "ffmpeg", "-y", "-i", original_path,
-        "-ss", str(offset_sec),
-        "-acodec", "copy",
-        trimmed_path
-    ]
-    subprocess.run(cmd, check=True)
-    return trimmed_path
@@ -0,0 +1,57 @@
+# worker_pool.py
+#
+# A spawn process pool that knows its worker PIDs. ProcessPoolExecutor keeps
+# its processes private, and shutdown(cancel_futures=True) only drops queued
+# work: a worker in the middle of a long Whisper window or llama.cpp generation
+# keeps running. Each worker here reports os.getpid() from its initializer, so
+# an abort or emergency stop can terminate the workers itself.
+
+import multiprocessing
+import os
+import signal
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+
+def _report_pid(pid_queue, initializer, initargs):
+    # Report first, so a worker stuck loading its model can still be terminated
+    pid_queue.put(os.getpid())
+    initializer(*initargs)
+
+
+class WorkerPool:
+    """ProcessPoolExecutor (spawn) whose workers can be terminated with terminate()."""
+
+    def __init__(self, max_workers, initializer, initargs=()):
+        context = multiprocessing.get_context("spawn")
+        self._pid_queue = context.SimpleQueue()
+        self._pids = set()
+        self._lock = threading.Lock()
+        self._executor = ProcessPoolExecutor(
+            max_workers=max_workers,
+            mp_context=context,
+            initializer=_report_pid,
+            initargs=(self._pid_queue, initializer, initargs)
+        )
+
+    def submit(self, fn, *args, **kwargs):
+        return self._executor.submit(fn, *args, **kwargs)
+
+    def worker_pids(self):
+        """PIDs of every worker started so far."""
+        with self._lock:
+            while not self._pid_queue.empty():
+                self._pids.add(self._pid_queue.get())
+            return set(self._pids)
+
+    def terminate(self):
+        """Terminates all workers, including those busy with a task. Pending futures are cancelled."""
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        for pid in self.worker_pids():
+            try:
+                os.kill(pid, signal.SIGTERM)  # TerminateProcess on Windows
+            except OSError:
+                pass  # Already exited
+
+    def shutdown(self, wait=True, cancel_futures=False):
+        self._executor.shutdown(wait=wait, cancel_futures=cancel_futures)